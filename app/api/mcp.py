@@ -1,487 +1,715 @@
-import json
+import asyncio
+import functools
+import orjson
+from contextvars import ContextVar
 from fastapi import APIRouter, Request
-from fastapi.responses import JSONResponse, Response
-from sse_starlette.sse import EventSourceResponse
-from pydantic import BaseModel
-from typing import Dict, Any, Optional, List
+from fastapi.responses import Response
+from sse_starlette.sse import EventSourceResponse, ServerSentEvent
+from typing import Dict, Any, Optional, List, Hashable, TypedDict, NotRequired, Union, AsyncIterator
 from loguru import logger
 from app.utils.parser import VideoParser
 
 from app.services.zilean import zilean_service
 from app.services.torbox import torbox_service
+from app.services.realdebrid import realdebrid_service
 from app.services.vector import vector_service
 from app.core.config import settings
+from app.core.cache import singleflight
+from app.core.responses import ORJSONResponse
 
 router = APIRouter()
 
+# Upstream calls currently in flight, shared by concurrent identical requests
+_inflight: Dict[Hashable, asyncio.Task] = {}
+
+# Memory-cache state of the current request's primary search ("HIT"/"MISS"),
+# surfaced as X-Cache on single (non-batch) responses
+_search_cache: ContextVar[Optional[str]] = ContextVar("search_cache", default=None)
+
+async def _search(**kwargs):
+    key = ("search",) + tuple(sorted(kwargs.items()))
+    return await asyncio.wait_for(
+        singleflight(_inflight, key, lambda: zilean_service.search_stream(**kwargs)),
+        settings.UPSTREAM_TIMEOUT_S
+    )
+
+# --- Static Manifests ---
+# Built once at import; every initialize / tools/list call returns the same objects
+
+# VOID-compatible manifest with explicit service names
+# VOID will display these exact labels in the Settings UI
+_INIT_RESULT = {
+    "name": "Omega",
+    "version": "1.0.0",
+    "description": "Multi-source provider with automatic Zilean DMM cache search",
+    "capabilities": ["source_provider", "resolver"],
+    "auth": {
+        "type": "multi_key",
+        "services": [
+            {
+                "id": "torbox",
+                "name": "TorBox",
+                "key_label": "TorBox API Key",
+                "required": False
+            },
+            {
+                "id": "realdebrid",
+                "name": "Real-Debrid",
+                "key_label": "Real-Debrid API Token",
+                "required": False
+            },
+            {
+                "id": "gemini",
+                "name": "Google Gemini",
+                "key_label": "Gemini API Key",
+                "required": False
+            }
+        ]
+    }
+}
+
+_TOOLS_LIST_RESULT = {
+    "tools": [
+        {
+            "name": "search",
+            "description": "Search Zilean (DMM Cache) for streams",
+            "inputSchema": {
+                "type": "object",
+                "properties": {
+                    "query": {"type": "string"},
+                    "imdb_id": {"type": "string"},
+                    "tmdb_id": {"type": "integer"}
+                }
+            }
+        },
+        {
+            "name": "resolve",
+            "description": "Resolve a stream via TorBox or Real-Debrid",
+            "inputSchema": {
+                "type": "object",
+                "properties": {
+                    "source_id": {"type": "string"},
+                    "info_hash": {"type": "string"},
+                    "season": {"type": "integer"},
+                    "episode": {"type": "integer"},
+                    "api_keys": {
+                        "type": "object",
+                        "properties": {
+                            "torbox": {"type": "string"},
+                            "realdebrid": {"type": "string"}
+                        }
+                    },
+                    "exclude_hevc": {"type": "boolean"},
+                    "exclude_eac3": {"type": "boolean"},
+                    "exclude_dolby_vision": {"type": "boolean"}
+                }
+            }
+        },
+        {
+            "name": "resolve_batch",
+            "description": "Check which info hashes are cached on TorBox in one call",
+            "inputSchema": {
+                "type": "object",
+                "properties": {
+                    "info_hashes": {
+                        "type": "array",
+                        "items": {"type": "string"}
+                    },
+                    "api_keys": {
+                        "type": "object",
+                        "properties": {
+                            "torbox": {"type": "string"}
+                        }
+                    }
+                },
+                "required": ["info_hashes"]
+            }
+        },
+        {
+            "name": "vector_chat",
+            "description": "Chat with the VECTOR AI Agent",
+            "inputSchema": {
+                "type": "object",
+                "properties": {
+                    "query": {"type": "string"},
+                    "history": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "role": {"type": "string"},
+                                "content": {"type": "string"}
+                            }
+                        }
+                    },
+                    "api_key": {"type": "string"},
+                    "user_context": {
+                        "type": "string",
+                        "description": "Additional context (e.g. watch history) to inform the AI."
+                    },
+                    "trakt_token": {
+                        "type": "string",
+                        "description": "Trakt access token for personalized features"
+                    },
+                    "tmdb_api_key": {
+                        "type": "string",
+                        "description": "TMDB API key for metadata lookups"
+                    },
+                    "stream": {
+                        "type": "boolean",
+                        "description": "Reply as an SSE stream of `delta` events, ending with the JSON-RPC response as a `message` event."
+                    }
+                },
+                "required": ["query"]
+            }
+        }
+    ]
+}
+
+# Pre-serialized once; orjson copies a Fragment's bytes verbatim into the
+# envelope, so these are never re-encoded (works inside batch arrays too)
+_INIT_RESULT_JSON = orjson.Fragment(orjson.dumps(_INIT_RESULT))
+_TOOLS_LIST_RESULT_JSON = orjson.Fragment(orjson.dumps(_TOOLS_LIST_RESULT))
+
 # --- Models ---
 
-class JsonRpcRequest(BaseModel):
+# Shape of one JSON-RPC request object. Type-checking only: the body is
+# parsed with orjson and checked by hand in _dispatch, never instantiated.
+class JsonRpcRequest(TypedDict):
     jsonrpc: str
     method: str
-    params: Optional[Dict[str, Any]] = None
-    id: Optional[Any] = None
+    params: NotRequired[Dict[str, Any]]
+    id: NotRequired[Any]
 
 # --- SSE Endpoint ---
 
+# Keep-alive comment, allocated once and shared by every connection
+_PING = ServerSentEvent(comment="ping")
+
+# Fixed per worker when the public URL is configured
+_PUBLIC_ENDPOINT_URL = settings.PUBLIC_BASE_URL.rstrip("/") + "/mcp/messages" if settings.PUBLIC_BASE_URL else None
+
+def _compute_from_headers(request: Request) -> str:
+    """
+    Slow path: rebuilds the public messages URL from the request headers.
+    """
+    # Construct the full public URL
+    # Use the Host header to get the correct domain (critical for Render)
+    host = request.headers.get("host", str(request.base_url).replace("http://", "").replace("https://", "").rstrip("/"))
+    
+    # Determine protocol (Render uses https)
+    proto = "https" if "render.com" in host or request.headers.get("x-forwarded-proto") == "https" else "http"
+    
+    return f"{proto}://{host}/mcp/messages"
+
 @router.get("/sse")
 async def sse_endpoint(request: Request):
     """
     MCP Handshake via Server-Sent Events.
     """
+    endpoint_url = _PUBLIC_ENDPOINT_URL or _compute_from_headers(request)
+
     async def event_generator():
-        # Construct the full public URL
-        # Use the Host header to get the correct domain (critical for Render)
-        host = request.headers.get("host", str(request.base_url).replace("http://", "").replace("https://", "").rstrip("/"))
+        logger.info("Client connected. Sending endpoint: {}", endpoint_url)
         
-        # Determine protocol (Render uses https)
-        proto = "https" if "render.com" in host or request.headers.get("x-forwarded-proto") == "https" else "http"
+        yield ServerSentEvent(event="endpoint", data=endpoint_url)
         
-        endpoint_url = f"{proto}://{host}/mcp/messages"
-
-        logger.info(f"Client connected. Sending endpoint: {endpoint_url}")
+        logger.debug("Endpoint event sent successfully: {}", endpoint_url)
         
-        yield {
-            "event": "endpoint",
-            "data": endpoint_url
+        # Keep alive: pings come from EventSourceResponse's own timer; the
+        # generator just parks (returning would close the stream) until the
+        # client disconnects and the response cancels it
+        await asyncio.Event().wait()
+
+    return EventSourceResponse(
+        event_generator(),
+        ping=20,
+        ping_message_factory=lambda: _PING,
+        # Stop nginx / CDN proxies from buffering the stream (older
+        # sse-starlette releases don't set this themselves)
+        headers={"X-Accel-Buffering": "no"},
+    )
+
+# --- Envelopes ---
+# Every response object is built here, so its layout lives in one place
+
+# HTTP status used when a single (non-batch) request fails with these codes
+_ERROR_STATUS = {-32700: 400, -32600: 400, -32601: 404, -32603: 500}
+
+# Stateless responses, shared by every request
+_NO_CONTENT = Response(status_code=204)
+_METHOD_NOT_FOUND = {"code": -32601, "message": "Method not found"}
+
+def _ok(req_id, result) -> Dict[str, Any]:
+    return {"jsonrpc": "2.0", "id": req_id, "result": result}
+
+def _err(req_id, code: int, message: str) -> Dict[str, Any]:
+    return {"jsonrpc": "2.0", "error": {"code": code, "message": message}, "id": req_id}
+
+def _text_result(req_id, text: str) -> Dict[str, Any]:
+    """
+    MCP tool result carrying a single text block.
+    """
+    return _ok(req_id, {"content": [{"type": "text", "text": text}]})
+
+def _method_not_found(req_id) -> Dict[str, Any]:
+    return {"jsonrpc": "2.0", "error": _METHOD_NOT_FOUND, "id": req_id}
+
+_MISSING_KEY_ERROR = {
+    "jsonrpc": "2.0",
+    "error": {
+        "code": -32000,
+        "message": "No API keys configured. Please add Real-Debrid or TorBox API key in VOID Settings."
+    }
+}
+
+# --- Method Handlers ---
+
+# Argument names whose values must never reach the logs
+_SECRET_MARKERS = ("key", "token")
+
+def _scrub_params(value):
+    """
+    Copy of `value` with API keys / tokens masked, for logging.
+    """
+    if isinstance(value, dict):
+        return {
+            k: "***" if isinstance(k, str) and any(m in k.lower() for m in _SECRET_MARKERS) else _scrub_params(v)
+            for k, v in value.items()
         }
-        
-        logger.info(f"Endpoint event sent successfully: {endpoint_url}")
-        
-        # Keep alive
-        import asyncio
-        while True:
-            await asyncio.sleep(20)
-            yield {"comment": "ping"}
+    if isinstance(value, list):
+        return [_scrub_params(v) for v in value]
+    return value
 
-    return EventSourceResponse(event_generator())
+# Handlers return the JSON-RPC response object, or None for notifications
+# (a streaming tool call returns its EventSourceResponse instead)
 
-# --- JSON-RPC Endpoint ---
+async def _handle_initialize(req_id, params):
+    return _ok(req_id, _INIT_RESULT_JSON)
 
-@router.post("/messages")
-async def handle_json_rpc(request: JsonRpcRequest):
+async def _handle_initialized(req_id, params):
+    # Notifications don't get responses in JSON-RPC spec
+    return None
+
+async def _handle_tools_list(req_id, params):
+    return _ok(req_id, _TOOLS_LIST_RESULT_JSON)
+
+async def _handle_tools_call(req_id, params):
+    tool = TOOLS.get(params.get("name"))
+    if tool is None:
+        return _method_not_found(req_id)
+    return await tool(req_id, params.get("arguments", {}))
+
+# --- Result Formatting ---
+
+_UNITS = ('B', 'KB', 'MB', 'GB', 'TB', 'PB')
+_UNIT_DIVS = tuple(1 << (i * 10) for i in range(len(_UNITS)))
+
+def format_size(size_bytes):
+    if not size_bytes:
+        return "Unknown"
+    # Zilean sends ints (size_bytes) or numeric strings (size); only the latter needs parsing
+    if not isinstance(size_bytes, (int, float)):
+        try:
+            size_bytes = float(size_bytes)
+        except (TypeError, ValueError):
+            return "Unknown"
+    try:
+        # Each unit is 10 more bits, so the bit length picks it without a loop
+        unit_idx = min(max((int(size_bytes).bit_length() - 1) // 10, 0), len(_UNITS) - 1)
+        return f"{size_bytes / _UNIT_DIVS[unit_idx]:.2f} {_UNITS[unit_idx]}"
+    except (ValueError, OverflowError):  # nan / inf
+        return "Unknown"
+
+# Titles repeat heavily across searches (same packs, re-queried pages)
+@functools.lru_cache(maxsize=16384)
+def infer_quality(title):
+    lower = title.lower()
+    if "2160p" in lower or "4k" in lower:
+        return "4K"
+    if "1080p" in lower:
+        return "1080p"
+    if "720p" in lower:
+        return "720p"
+    if "480p" in lower:
+        return "480p"
+    return "Unknown"
+
+def safe_int(val):
+    if isinstance(val, int) or val is None:
+        return val
+    try:
+        return int(val)
+    except (TypeError, ValueError):
+        return None
+
+# --- Tool Handlers ---
+
+async def _first_non_empty(tasks: List[asyncio.Task]):
     """
-    MCP Method Handler.
+    Returns (task, result) for the first task, in list order, with a non-empty
+    result, or (None, []). Later tasks keep running while earlier ones are
+    awaited; whatever is left is cancelled on the way out.
+    A timed-out attempt counts as a miss; the timeout is re-raised only if no
+    attempt returned results.
     """
+    timed_out = None
     try:
-        method = request.method
-        params = request.params or {}
-        req_id = request.id
-        
-        logger.info(f"Method: {method} | Params: {params}")
-
-        if method == "initialize":
-            # Return VOID-compatible manifest with explicit service names
-            # VOID will display these exact labels in the Settings UI
-            return {
-                "jsonrpc": "2.0",
-                "id": req_id,
-                "result": {
-                    "name": "Omega",
-                    "version": "1.0.0",
-                    "description": "Multi-source provider with automatic Zilean DMM cache search",
-                    "capabilities": ["source_provider", "resolver"],
-                    "auth": {
-                        "type": "multi_key",
-                        "services": [
-                            {
-                                "id": "torbox",
-                                "name": "TorBox",
-                                "key_label": "TorBox API Key",
-                                "required": False
-                            },
-                            {
-                                "id": "realdebrid",
-                                "name": "Real-Debrid",
-                                "key_label": "Real-Debrid API Token",
-                                "required": False
-                            },
-                            {
-                                "id": "gemini",
-                                "name": "Google Gemini",
-                                "key_label": "Gemini API Key",
-                                "required": False
-                            }
-                        ]
-                    }
-                }
-            }
+        for task in tasks:
+            try:
+                result = await task
+            except asyncio.TimeoutError as e:
+                timed_out = timed_out or e
+                continue
+            if result:
+                return task, result
+        if timed_out:
+            raise timed_out
+        return None, []
+    finally:
+        for task in tasks:
+            task.cancel()
 
+_HEX_DIGITS = frozenset("0123456789abcdef")
 
-        if method == "notifications/initialized":
-             # Notifications don't get responses in JSON-RPC spec
-             return Response(status_code=204)  # No Content
-
-
-        if method == "tools/list":
-            return {
-                "jsonrpc": "2.0",
-                "id": req_id,
-                "result": {
-                    "tools": [
-                        {
-                            "name": "search",
-                            "description": "Search Zilean (DMM Cache) for streams",
-                            "inputSchema": {
-                                "type": "object",
-                                "properties": {
-                                    "query": {"type": "string"},
-                                    "imdb_id": {"type": "string"},
-                                    "tmdb_id": {"type": "integer"}
-                                }
-                            }
-                        },
-                        {
-                            "name": "resolve",
-                            "description": "Resolve a stream via TorBox or Real-Debrid",
-                            "inputSchema": {
-                                "type": "object",
-                                "properties": {
-                                    "source_id": {"type": "string"},
-                                    "info_hash": {"type": "string"},
-                                    "season": {"type": "integer"},
-                                    "episode": {"type": "integer"},
-                                    "api_keys": {
-                                        "type": "object",
-                                        "properties": {
-                                            "torbox": {"type": "string"},
-                                            "realdebrid": {"type": "string"}
-                                        }
-                                    },
-                                    "exclude_hevc": {"type": "boolean"},
-                                    "exclude_eac3": {"type": "boolean"},
-                                    "exclude_dolby_vision": {"type": "boolean"}
-                                }
-                            }
-                        },
-                        {
-                            "name": "vector_chat",
-                            "description": "Chat with the VECTOR AI Agent",
-                            "inputSchema": {
-                                "type": "object",
-                                "properties": {
-                                    "query": {"type": "string"},
-                                    "history": {
-                                        "type": "array",
-                                        "items": {
-                                            "type": "object",
-                                            "properties": {
-                                                "role": {"type": "string"},
-                                                "content": {"type": "string"}
-                                            }
-                                        }
-                                    },
-                                    "api_key": {"type": "string"},
-                                    "user_context": {
-                                        "type": "string",
-                                        "description": "Additional context (e.g. watch history) to inform the AI."
-                                    },
-                                    "trakt_token": {
-                                        "type": "string",
-                                        "description": "Trakt access token for personalized features"
-                                    },
-                                    "tmdb_api_key": {
-                                        "type": "string",
-                                        "description": "TMDB API key for metadata lookups"
-                                    }
-                                },
-                                "required": ["query"]
-                            }
-                        }
-                    ]
-                }
-            }
+def _opt_int(value):
+    return int(value) if value is not None else None
 
-        if method == "tools/call":
-            tool_name = params.get("name")
-            args = params.get("arguments", {})
-            
-            if tool_name == "search":
-                # Client sends: title, type, imdb_id, tmdb_id, year, season, episode
-                title = args.get("title")
-                imdb = args.get("imdb_id")
-                year = args.get("year")
-                media_type = args.get("type")  # 'movie' or 'show'
-                season = args.get("season")
-                episode = args.get("episode")
-                
-                # Build search query
-                query = title
-                if media_type == "show" and season and episode:
-                    query = f"{title} S{season:02d}E{episode:02d}"
-                
-                # Zilean Generic Search
-                # Attempt 1: Structured Search
-                results = await zilean_service.search_stream(
-                    title=title, 
-                    year=year, 
-                    imdb_id=imdb, 
-                    season=season, 
-                    episode=episode
-                )
-
-                # Attempt 2: Fallback to String Query (if no results and is a show)
-                if not results and media_type == "show" and season and episode:
-                    fallback_query = f"{title} S{season:02d}E{episode:02d}"
-                    logger.info(f"Structured search returned 0 results. Trying fallback: {fallback_query}")
-                    results = await zilean_service.search_stream(
-                        title=fallback_query,
-                        # Clear specific filters to rely on string matching
-                        year=None,
-                        imdb_id=None, 
-                        season=None,
-                        episode=None
-                    )
-
-                # Attempt 3: Desperation Search (Title Only)
-                # If "Show S01E02" fails, try just "Show Name" and hoping Zilean finds a Season Pack or misnamed file.
-                if not results and media_type == "show":
-                    logger.info(f"Fallback search returned 0 results. Trying desperation search: {title}")
-                    desperation_results = await zilean_service.search_stream(
-                        title=title,
-                        year=None,
-                        imdb_id=None, 
-                        season=None,
-                        episode=None
-                    )
-                    
-                    # Smart Filter: Remove obvious mismatches to reduce clutter
-                    # Regex to find SxxEyy or 1x02 patterns
-                    if desperation_results and season:
-                        filtered_desperation = []
-                        import re
-                        
-                        # Patterns: S01E02, 1x02, S01
-                        # We want to keep:
-                        # 1. Exact Episode Matches
-                        # 2. Season Packs (Match Season, No Episode)
-                        # 3. Ambiguous files (No S/E detected)
-                        
-                        for item in desperation_results:
-                            item_title = (item.get("raw_title") or item.get("filename") or "").upper()
-                            
-                            # Parse Season
-                            # Look for S01, Season 1, 1x
-                            s_match = re.search(r'(?:S|SEASON\W?)(\d{1,2})|(\d{1,2})[xX]\d+', item_title)
-                            item_season = int(s_match.group(1) or s_match.group(2)) if s_match else None
-                            
-                            # Parse Episode
-                            # Look for E01, x01
-                            e_match = re.search(r'[xE](\d{1,3})', item_title)
-                            item_episode = int(e_match.group(1)) if e_match else None
-                            
-                            # Logic:
-                            # If we detect a Season, it MUST match the requested season
-                            if item_season and item_season != season:
-                                continue # Wrong Season
-                                
-                            # If we detect an Episode, it MUST match the requested episode
-                            # UNLESS we want to allow full season packs, but usually season packs don't have "E01" in the main title 
-                            # (or if they do, it's usually "S01E01-E10")
-                            # For safety, if we see a specific single episode number that ISN'T ours, skip it.
-                            if item_episode and episode and item_episode != episode:
-                                # Check for multi-episode range (e.g. E01-E10) - simplifying for now
-                                # If simple mismatch, skip
-                                continue 
-                                
-                            filtered_desperation.append(item)
-                            
-                        logger.info(f"Desperation search found {len(desperation_results)}, filtered to {len(filtered_desperation)}")
-                        results = filtered_desperation
-                    else:
-                        results = desperation_results
-                
-                # Format for MCP
-                # We return a list of "StreamSource" compatible JSONs
-                # For now, just raw dump; Client agg should handle it if mapped correctly,
-                # OR we map it here to standard VOID format.
-                # Let's map to standard VOID structure:
-                # { "id": "hash", "name": "...", "size": "...", "provider": "Omega", "info_hash": "..." }
-                
-                def format_size(size_bytes):
-                    if not size_bytes:
-                        return "Unknown"
-                    try:
-                        bytes_val = float(size_bytes)
-                        for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
-                            if bytes_val < 1024.0:
-                                return f"{bytes_val:.2f} {unit}"
-                            bytes_val /= 1024.0
-                        return f"{bytes_val:.2f} PB"
-                    except:
-                        return "Unknown"
-
-                def infer_quality(title):
-                    lower = title.lower()
-                    if "2160p" in lower or "4k" in lower:
-                        return "4K"
-                    if "1080p" in lower:
-                        return "1080p"
-                    if "720p" in lower:
-                        return "720p"
-                    if "480p" in lower:
-                        return "480p"
-                    return "Unknown"
-
-                def safe_int(val):
-                    try:
-                        return int(val)
-                    except:
-                        return None
-
-                mapped_results = []
-                for res in results:
-                    # Note: Need real Zilean response structure here.
-                    # Assuming Zilean returns list of {raw_title, size, info_hash}
-                    filename = res.get("filename") or res.get("raw_title") or query
-                    
-                    # Zilean might return 'size' as string or 'size_bytes' as int
-                    raw_size = res.get("size_bytes")
-                    if raw_size is None and str(res.get("size", "")).isdigit():
-                         raw_size = res.get("size")
-                         
-                    mapped_results.append({
-                        "id": res.get("info_hash"),
-                        "provider": "Omega", # Must match Server Name for client routing
-                        "title": filename,
-                        "size": format_size(raw_size or res.get("size")), 
-                        "size_bytes": safe_int(raw_size),
-                        "quality": infer_quality(filename) + (f" [{VideoParser.get_release_group(filename)}]" if VideoParser.get_release_group(filename) else ""),
-                        "info_hash": res.get("info_hash"),
-                        "type": "movie", # TODO: infer
-                        "cached": True # Zilean results are always cached
-                    })
-                
-                return {
-                    "jsonrpc": "2.0",
-                    "id": req_id,
-                    "result": {
-                        "content": [
-                            {"type": "text", "text": json.dumps(mapped_results)}
-                        ]
-                    }
-                }
+def _map_result(res: dict, query: str) -> dict:
+    """
+    One Zilean row ({raw_title/filename, info_hash, size or size_bytes}) as a
+    VOID StreamSource. Zilean might return 'size' as string or 'size_bytes' as int.
+    """
+    info_hash = res.get("info_hash")
+    size = res.get("size")
+    size_bytes = res.get("size_bytes")
+    if size_bytes is None and str(size).isdigit():
+        size_bytes = size
+    filename = res.get("filename") or res.get("raw_title") or query
+    group = VideoParser.get_release_group(filename)
+    return {
+        "id": info_hash,
+        "provider": "Omega", # Must match Server Name for client routing
+        "title": filename,
+        "size": format_size(size_bytes or size),
+        "size_bytes": safe_int(size_bytes),
+        "quality": infer_quality(filename) + (f" [{group}]" if group else ""),
+        "info_hash": info_hash,
+        "type": "movie", # TODO: infer
+        "cached": True # Zilean results are always cached
+    }
 
-            elif tool_name == "resolve":
-                # Get API keys from VOID client (passed via manifest)
-                api_keys = args.get("api_keys", {})
-                
-                # Smart Fallback Logic
-                # Priority: Real-Debrid > TorBox
-                # We try services in order. If one fails (returns None), we try the next.
-                
-                services_to_try = []
-
-                # 1. Real-Debrid (Preferred for Cache)
-                if api_keys.get("realdebrid") or settings.REALDEBRID_API_KEY:
-                    rd_key = api_keys.get("realdebrid") or settings.REALDEBRID_API_KEY
-                    from app.services.realdebrid import RealDebridService
-                    services_to_try.append(("Real-Debrid", RealDebridService(), rd_key))
-
-                # 2. TorBox (Fallback)
-                if api_keys.get("torbox") or settings.TORBOX_API_KEY:
-                    tb_key = api_keys.get("torbox") or settings.TORBOX_API_KEY
-                    services_to_try.append(("TorBox", torbox_service, tb_key))
-
-                if not services_to_try:
-                    return {
-                        "jsonrpc": "2.0", 
-                        "id": req_id, 
-                        "error": {
-                            "code": -32000, 
-                            "message": "No API keys configured. Please add Real-Debrid or TorBox API key in VOID Settings."
-                        }
-                    }
+async def _tool_search(req_id, args):
+    # Client sends: title, type, imdb_id, tmdb_id, year, season, episode
+    title = args.get("title")
+    imdb = args.get("imdb_id")
+    media_type = args.get("type")  # 'movie' or 'show'
 
-                stream_url = None
-                service_used = None
-                
-                info_hash = args.get("info_hash")
-                if not info_hash:
-                     return {
-                        "jsonrpc": "2.0", "id": req_id, 
-                        "error": {"code": -32602, "message": "Missing info_hash"}
-                    }
+    # JSON clients often send numbers as strings ("1"); coerce once so the
+    # :02d formatting below works and "1"/1 share the same cache keys
+    try:
+        year = _opt_int(args.get("year"))
+        season = _opt_int(args.get("season"))
+        episode = _opt_int(args.get("episode"))
+    except (TypeError, ValueError):
+        return _err(req_id, -32602, "year, season and episode must be integers")
 
-                source_id = args.get("source_id") or info_hash
-                magnet = args.get("magnet") or ""
-                season = args.get("season")
-                episode = args.get("episode")
-                
-                exclude_hevc = args.get("exclude_hevc", False)
-                exclude_eac3 = args.get("exclude_eac3", False)
-                exclude_dolby_vision = args.get("exclude_dolby_vision", False)
-
-                for name, service, key in services_to_try:
-                    logger.info(f"Attempting resolution with {name}...")
-                    try:
-                        stream_url = await service.resolve_stream(
-                            source_id=source_id,
-                            info_hash=info_hash,
-                            magnet=magnet,
-                            api_key=key,
-                            season=season,
-                            episode=episode,
-                            exclude_hevc=exclude_hevc,
-                            exclude_eac3=exclude_eac3,
-                            exclude_dolby_vision=exclude_dolby_vision
-                        )
-                        
-                        if stream_url:
-                            service_used = name
-                            logger.info(f"Successfully resolved with {name}")
-                            break
-                        else:
-                            logger.warning(f"{name} could not resolve stream (not cached or error).")
-                            
-                    except Exception as e:
-                        logger.error(f"{name} resolution error: {e}")
-                        # Continue to next service
-                
-                if stream_url:
-                     return {
-                        "jsonrpc": "2.0",
-                        "id": req_id,
-                        "result": {
-                            "content": [
-                                {"type": "text", "text": json.dumps({"success": True, "stream": {"url": stream_url}})}
-                            ]
-                        }
-                    }
-                else:
-                     return {
-                        "jsonrpc": "2.0", "id": req_id, 
-                        "error": {"code": -32001, "message": "Failed to resolve stream"}
-                    }
+    # Build search query
+    query = title
+    if media_type == "show" and season and episode:
+        query = f"{title} S{season:02d}E{episode:02d}"
 
-            elif tool_name == "vector_chat":
-                query = args.get("query")
-                history = args.get("history", [])
-                api_key = args.get("api_key")
-                user_context = args.get("user_context")
-                trakt_token = args.get("trakt_token")
-                tmdb_api_key = args.get("tmdb_api_key")
-                
-                response_text = await vector_service.chat(query, history, api_key, user_context, trakt_token, tmdb_api_key)
-                
-                return {
-                    "jsonrpc": "2.0",
-                    "id": req_id,
-                    "result": {
-                        "content": [
-                            {"type": "text", "text": response_text}
-                        ]
-                    }
-                }
+    # Zilean Generic Search
+    # All attempts start together so a miss on the structured search doesn't
+    # cost another full round-trip per fallback; results are still taken in
+    # priority order and the lower-priority searches are cancelled once one hits.
+    # Attempt 1: Structured Search
+    attempts = [_search(
+        title=title, 
+        year=year, 
+        imdb_id=imdb, 
+        season=season, 
+        episode=episode
+    )]
+
+    # Attempt 2: Fallback to String Query (if is a show)
+    if media_type == "show" and season and episode:
+        attempts.append(_search(
+            title=query,
+            # Clear specific filters to rely on string matching
+            year=None,
+            imdb_id=None, 
+            season=None,
+            episode=None
+        ))
+
+    # Attempt 3: Desperation Search (Title Only)
+    # If "Show S01E02" fails, try just "Show Name" and hoping Zilean finds a Season Pack or misnamed file.
+    if media_type == "show":
+        attempts.append(_search(
+            title=title,
+            year=None,
+            imdb_id=None, 
+            season=None,
+            episode=None
+        ))
+
+    _search_cache.set("HIT" if zilean_service.is_cached(title, year, imdb, season, episode) else "MISS")
+    tasks = [asyncio.ensure_future(a) for a in attempts]
+    desperation_task = tasks[-1] if media_type == "show" else None
+
+    winner, results = await _first_non_empty(tasks)
+    if winner is not None and winner is not tasks[0]:
+        logger.info("Structured search returned 0 results. Used attempt {} for: {}", tasks.index(winner) + 1, title)
+
+    if winner is not None and winner is desperation_task:
+        # Smart Filter: Remove obvious mismatches to reduce clutter
+        if results and season:
+            filtered_desperation = zilean_service.filter_episode(results, season, episode)
+            logger.info("Desperation search found {}, filtered to {}", len(results), len(filtered_desperation))
+            results = filtered_desperation
+
+    # Format for MCP
+    # We return a list of "StreamSource" compatible JSONs
+    # For now, just raw dump; Client agg should handle it if mapped correctly,
+    # OR we map it here to standard VOID format.
+    # Let's map to standard VOID structure:
+    # { "id": "hash", "name": "...", "size": "...", "provider": "Omega", "info_hash": "..." }
+
+    mapped_results = [_map_result(res, query) for res in results]
+
+    return _text_result(req_id, orjson.dumps(mapped_results).decode())
+
+async def _tool_resolve(req_id, args):
+    # Get API keys from VOID client (passed via manifest)
+    api_keys = args.get("api_keys", {})
+
+    rd_key = api_keys.get("realdebrid") or settings.REALDEBRID_API_KEY
+    tb_key = api_keys.get("torbox") or settings.TORBOX_API_KEY
+    if not (rd_key or tb_key):
+        return _MISSING_KEY_ERROR | {"id": req_id}
+
+    # Smart Fallback Logic
+    # Priority: Real-Debrid > TorBox
+    # We try services in order. If one fails (returns None), we try the next.
+
+    services_to_try = []
+
+    # 1. Real-Debrid (Preferred for Cache)
+    if rd_key:
+        services_to_try.append(("Real-Debrid", realdebrid_service, rd_key))
+
+    # 2. TorBox (Fallback)
+    if tb_key:
+        services_to_try.append(("TorBox", torbox_service, tb_key))
+
+    stream_url = None
+    service_used = None
+
+    # Normalize once: lowercase hex is what the debrid caches and our
+    # in-flight keys compare against, and malformed hashes never leave the box
+    info_hash = (args.get("info_hash") or "").lower()
+    if not info_hash:
+        return _err(req_id, -32602, "Missing info_hash")
+    if len(info_hash) != 40 or not _HEX_DIGITS.issuperset(info_hash):
+        return _err(req_id, -32602, "Invalid info_hash")
+
+    source_id = args.get("source_id") or info_hash
+    magnet = args.get("magnet") or ""
+    try:
+        season = _opt_int(args.get("season"))
+        episode = _opt_int(args.get("episode"))
+    except (TypeError, ValueError):
+        return _err(req_id, -32602, "season and episode must be integers")
+
+    exclude_hevc = args.get("exclude_hevc", False)
+    exclude_eac3 = args.get("exclude_eac3", False)
+    exclude_dolby_vision = args.get("exclude_dolby_vision", False)
+
+    for name, service, key in services_to_try:
+        logger.info("Attempting resolution with {}...", name)
+        try:
+            flight_key = ("resolve", name, key, info_hash, season, episode, exclude_hevc, exclude_eac3, exclude_dolby_vision)
+            stream_url = await asyncio.wait_for(
+                singleflight(_inflight, flight_key, lambda: service.resolve_stream(
+                    source_id=source_id,
+                    info_hash=info_hash,
+                    magnet=magnet,
+                    api_key=key,
+                    season=season,
+                    episode=episode,
+                    exclude_hevc=exclude_hevc,
+                    exclude_eac3=exclude_eac3,
+                    exclude_dolby_vision=exclude_dolby_vision
+                )),
+                settings.RESOLVE_TIMEOUT_S
+            )
+
+            if stream_url:
+                service_used = name
+                logger.info("Successfully resolved with {}", name)
+                break
+            else:
+                logger.warning("{} could not resolve stream (not cached or error).", name)
+
+        except asyncio.TimeoutError:
+            logger.warning("{} resolution timed out after {}s", name, settings.RESOLVE_TIMEOUT_S)
+        except Exception as e:
+            logger.error("{} resolution error: {}", name, e)
+            # Continue to next service
 
-        return JSONResponse(
-            status_code=404, 
-            content={"jsonrpc": "2.0", "error": {"code": -32601, "message": "Method not found"}, "id": req_id}
+    if stream_url:
+        return _text_result(req_id, orjson.dumps({"success": True, "stream": {"url": stream_url}}).decode())
+    else:
+        return _err(req_id, -32001, "Failed to resolve stream")
+
+async def _tool_resolve_batch(req_id, args):
+    # Lets clients learn the cache state of a whole result page in one
+    # round-trip, then only call `resolve` for the hashes that are cached
+    tb_key = args.get("api_keys", {}).get("torbox") or settings.TORBOX_API_KEY
+    if not tb_key:
+        return _err(req_id, -32000, "No TorBox API key configured. Please add it in VOID Settings.")
+
+    raw_hashes = args.get("info_hashes")
+    if not isinstance(raw_hashes, list):
+        return _err(req_id, -32602, "info_hashes must be a list")
+
+    info_hashes = list(dict.fromkeys(h.lower() for h in raw_hashes if isinstance(h, str)))
+    if any(len(h) != 40 or not _HEX_DIGITS.issuperset(h) for h in info_hashes):
+        return _err(req_id, -32602, "Invalid info_hash")
+
+    cached = await asyncio.wait_for(
+        torbox_service.check_cached(tb_key, info_hashes),
+        settings.UPSTREAM_TIMEOUT_S
+    )
+
+    return _text_result(req_id, orjson.dumps(cached).decode())
+
+async def _tool_vector_chat(req_id, args):
+    query = args.get("query")
+    history = args.get("history", [])
+    api_key = args.get("api_key")
+    user_context = args.get("user_context")
+    trakt_token = args.get("trakt_token")
+    tmdb_api_key = args.get("tmdb_api_key")
+
+    if args.get("stream"):
+        chunks = vector_service.chat_stream(query, history, api_key, user_context, trakt_token, tmdb_api_key)
+        return EventSourceResponse(
+            _stream_chat(req_id, chunks),
+            ping=15,  # Generations (plus tool calls) can go quiet for a while
+            ping_message_factory=lambda: _PING,
+            headers={"X-Accel-Buffering": "no"},
         )
 
+    response_text = await vector_service.chat(query, history, api_key, user_context, trakt_token, tmdb_api_key)
+
+    return _text_result(req_id, response_text)
+
+async def _stream_chat(req_id, chunks: AsyncIterator[str]):
+    """
+    Forwards text deltas as they are generated, then the full answer as the
+    regular JSON-RPC response so non-streaming clients still get a result.
+    """
+    parts = []
+    try:
+        async for delta in chunks:
+            parts.append(delta)
+            yield ServerSentEvent(event="delta", data=orjson.dumps({"delta": delta}).decode())
+        response = _text_result(req_id, "".join(parts))
     except Exception as e:
-        logger.exception("MCP Error")
-        return JSONResponse(
-            status_code=500, 
-            content={"jsonrpc": "2.0", "error": {"code": -32603, "message": str(e)}, "id": request.id}
-        )
+        logger.error("MCP Error: {}", type(e).__name__)
+        response = _err(req_id, -32603, str(e))
+    yield ServerSentEvent(event="message", data=orjson.dumps(response).decode())
+
+TOOLS = {
+    "search": _tool_search,
+    "resolve": _tool_resolve,
+    "resolve_batch": _tool_resolve_batch,
+    "vector_chat": _tool_vector_chat,
+}
+
+HANDLERS = {
+    "initialize": _handle_initialize,
+    "notifications/initialized": _handle_initialized,
+    "tools/list": _handle_tools_list,
+    "tools/call": _handle_tools_call,
+}
+
+# --- JSON-RPC Endpoint ---
+
+async def _dispatch(item: JsonRpcRequest) -> Union[Dict[str, Any], Response, None]:
+    """
+    Runs a single JSON-RPC request object through its method handler.
+    """
+    if not isinstance(item, dict):
+        return _err(None, -32600, "Invalid Request")
+
+    req_id = item.get("id")
+    method = item.get("method")
+    params = item.get("params") or {}
+    if not isinstance(method, str) or not isinstance(params, dict):
+        return _err(req_id, -32600, "Invalid Request")
+
+    try:
+        # Params can carry API keys - keep them out of INFO and only
+        # render them when DEBUG is actually enabled
+        logger.info("Method: {}", method)
+        logger.opt(lazy=True).debug("Method: {} | Params: {}", lambda: method, lambda: _scrub_params(params))
+
+        handler = HANDLERS.get(method)
+        if handler is None:
+            return _method_not_found(req_id)
+        return await handler(req_id, params)
+
+    except asyncio.TimeoutError:
+        logger.warning("Upstream timeout on {}", method)
+        return _err(req_id, -32002, "Upstream request timed out")
+    except Exception as e:
+        # Tracebacks can carry request args (API keys) and are costly to render
+        if settings.DEBUG_TRACEBACKS:
+            logger.exception("MCP Error")
+        else:
+            logger.error("MCP Error: {}", type(e).__name__)
+        return _err(req_id, -32603, str(e))
+
+@router.post("/messages")
+async def handle_json_rpc(request: Request):
+    """
+    MCP Method Handler.
+    The envelope is parsed straight from the raw body; it is only four fields,
+    so a Pydantic model per request is not worth its cost here.
+    Accepts a single request object or a JSON-RPC batch (array), whose
+    entries are dispatched concurrently.
+    """
+    try:
+        payload = orjson.loads(await request.body())
+    except orjson.JSONDecodeError:
+        return ORJSONResponse(_err(None, -32700, "Parse error"), status_code=400)
+
+    if isinstance(payload, list):
+        if not payload:
+            return ORJSONResponse(_err(None, -32600, "Invalid Request"), status_code=400)
+        results = await asyncio.gather(*(_dispatch(item) for item in payload))
+        responses = [
+            # A stream can't be embedded in a batch array
+            _err(item.get("id"), -32600, "Streaming calls cannot be batched") if isinstance(r, Response) else r
+            for item, r in zip(payload, results)
+            # Notifications (entries without an "id") get no reply, even on error
+            if r is not None and not (isinstance(item, dict) and "id" not in item)
+        ]
+        if not responses:
+            return _NO_CONTENT  # Batch of notifications only
+        return ORJSONResponse(responses)
+
+    response = await _dispatch(payload)
+    if response is None:
+        return _NO_CONTENT  # No Content
+    if isinstance(response, Response):
+        return response  # Streaming tool call (SSE)
+
+    error = response.get("error")
+    status_code = _ERROR_STATUS.get(error["code"], 200) if error else 200
+    cache_status = _search_cache.get()
+    headers = {"X-Cache": cache_status} if cache_status else None
+    return ORJSONResponse(response, status_code=status_code, headers=headers)
@@ -0,0 +1,47 @@
+import time
+
+from loguru import logger
+
+
+class CircuitBreaker:
+    """
+    Process-local circuit breaker for an upstream.
+
+    After `fail_max` consecutive failures the circuit opens and callers skip
+    the upstream for `reset_timeout` seconds. Then it is half-open: the first
+    caller through is the one trial, while everyone else keeps skipping. A
+    success closes the circuit, a failure opens it again right away. A trial
+    that never reports back frees the next trial after another `reset_timeout`.
+    """
+
+    def __init__(self, name: str, fail_max: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.fail_max = fail_max
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._open_until = 0.0  # 0.0 while closed
+
+    @property
+    def is_open(self) -> bool:
+        """
+        True if the caller should skip the upstream. Once the open window has
+        passed, the caller that reads False here is admitted as the trial.
+        """
+        if not self._open_until:
+            return False
+        now = time.monotonic()
+        if now < self._open_until:
+            return True
+        # Half-open: hold the others off while this caller's trial runs
+        self._open_until = now + self.reset_timeout
+        return False
+
+    def record_success(self):
+        self._failures = 0
+        self._open_until = 0.0
+
+    def record_failure(self):
+        self._failures += 1
+        if self._failures >= self.fail_max:
+            self._open_until = time.monotonic() + self.reset_timeout
+            logger.warning(f"{self.name} circuit open for {self.reset_timeout:.0f}s after {self._failures} consecutive failures")
@@ -0,0 +1,166 @@
+import asyncio
+import hashlib
+import inspect
+import json
+import secrets
+import time
+from functools import wraps
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+import redis.asyncio as redis
+from loguru import logger
+from app.core.config import settings
+
+_redis_client: Optional[redis.Redis] = None
+
+
+def get_redis() -> Optional[redis.Redis]:
+    """
+    Returns the shared Redis client, or None when REDIS_URL is not configured.
+    """
+    global _redis_client
+    if _redis_client is None and settings.REDIS_URL:
+        _redis_client = redis.from_url(settings.REDIS_URL)
+    return _redis_client
+
+
+def make_cache_key(prefix: str, kwargs: Dict[str, Any]) -> str:
+    """
+    Stable key for a call: SHA-256 over the sorted JSON of its arguments.
+    """
+    payload = json.dumps(kwargs, sort_keys=True, default=str)
+    return f"{prefix}:{hashlib.sha256(payload.encode()).hexdigest()}"
+
+
+# Delete the lock only if it still holds our token: once it has expired and
+# another worker took it over, a plain DEL would release theirs
+_RELEASE_SCRIPT = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("DEL", KEYS[1])
+end
+return 0
+"""
+
+
+async def _release(client: redis.Redis, lock_key: str, token: str):
+    try:
+        await client.eval(_RELEASE_SCRIPT, 1, lock_key, token)
+    except redis.RedisError:
+        pass
+
+
+def redis_memoize(ttl: int = 300, prefix: str = "cache", lock_ms: int = 10000, lock_wait: float = 2.0, poll_interval: float = 0.05, empty_ttl: Optional[int] = None):
+    """
+    Caches the JSON result of an async function in Redis for `ttl` seconds
+    (`empty_ttl` seconds instead for an empty result, when given).
+
+    On a miss, a short `SET NX PX` lock makes sure only one worker hits the
+    upstream; the others poll for the result for up to `lock_wait` seconds
+    before giving up and calling through themselves. `lock_ms` must cover
+    the whole call, or a second worker can take the lock mid-call.
+    A `None` result is treated as a failure and is not cached: the lock
+    holder leaves a brief miss marker (with its lock token) instead, and
+    waiters that see it from the holder they were waiting on return None
+    rather than repeating the call. A waiter that sees the lock
+    vanish without a result (holder died) tries to take it itself.
+    Falls back to a plain call if Redis is not configured or unreachable.
+    """
+    # Long enough for every waiter to see it at least once
+    miss_ms = max(2000, int(poll_interval * 4000))
+
+    def decorator(func: Callable):
+        signature = inspect.signature(func)
+
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            client = get_redis()
+            if client is None:
+                return await func(*args, **kwargs)
+
+            # Normalize positional/keyword usage so both hit the same key
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key_args = {k: v for k, v in bound.arguments.items() if k != "self"}
+            key = make_cache_key(prefix, key_args)
+            lock_key = f"{key}:lock"
+            miss_key = f"{key}:miss"
+            token = secrets.token_hex(16)
+
+            try:
+                cached = await client.get(key)
+                if cached is not None:
+                    return json.loads(cached)
+
+                deadline = time.monotonic() + lock_wait
+                while not await client.set(lock_key, token, nx=True, px=lock_ms):
+                    # Someone else is fetching this key - wait for their result
+                    locked = True
+                    holder = None  # Token of the lock holder we saw last
+                    while locked and time.monotonic() < deadline:
+                        await asyncio.sleep(poll_interval)
+                        cached, missed, locked = await client.mget(key, miss_key, lock_key)
+                        if cached is not None:
+                            return json.loads(cached)
+                        # Markers carry their holder's token, so an older
+                        # holder's failure doesn't cut short the current call
+                        if missed is not None and missed == holder:
+                            return None  # The holder's call just failed
+                        holder = locked
+                    if locked:
+                        token = None  # Gave up waiting, call through unlocked
+                        break
+                    # The holder went away without a result: try to take over
+            except redis.RedisError as e:
+                logger.warning(f"Redis unavailable, skipping cache: {e}")
+                return await func(*args, **kwargs)
+
+            try:
+                result = await func(*args, **kwargs)
+            except Exception:
+                if token is not None:
+                    await _mark_miss(client, miss_key, token, miss_ms)
+                    await _release(client, lock_key, token)
+                raise
+
+            if result is not None:
+                try:
+                    expiry = empty_ttl if empty_ttl is not None and not result else ttl
+                    await client.setex(key, expiry, json.dumps(result))
+                except redis.RedisError as e:
+                    logger.warning(f"Redis write failed for {prefix}: {e}")
+            elif token is not None:
+                await _mark_miss(client, miss_key, token, miss_ms)
+            if token is not None:
+                await _release(client, lock_key, token)
+            return result
+
+        return wrapper
+    return decorator
+
+
+async def _mark_miss(client: redis.Redis, miss_key: str, token: str, miss_ms: int):
+    try:
+        await client.set(miss_key, token, px=miss_ms)
+    except redis.RedisError:
+        pass
+
+
+async def singleflight(inflight: Dict[Hashable, asyncio.Task], key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+    """
+    Shares one in-flight call between concurrent callers using the same key.
+
+    The call runs as its own task, so a caller that gives up (timeout or
+    client disconnect) doesn't cancel it for everyone else waiting on it.
+    """
+    task = inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(factory())
+        inflight[key] = task
+        task.add_done_callback(lambda t: _forget(inflight, key, t))
+    return await asyncio.shield(task)
+
+
+def _forget(inflight: Dict[Hashable, asyncio.Task], key: Hashable, task: asyncio.Task):
+    inflight.pop(key, None)
+    if not task.cancelled():
+        task.exception()  # Mark as retrieved even if every waiter went away
@@ -14,7 +14,35 @@ class Settings(BaseSettings):
     
     # Tier 3: AI Brain
     GEMINI_API_KEY: Optional[str] = None
-    
+
+    # Public URL handed to SSE clients (e.g. https://omega.onrender.com).
+    # When unset it is derived from the request headers on every connection.
+    PUBLIC_BASE_URL: Optional[str] = None
+
+    # `python main.py` server. Caches are per-process, so with more than one
+    # worker set REDIS_URL to share search results between them.
+    PORT: int = 8000
+    WORKERS: int = 1
+
+    # Shared Cache (Optional - caching is skipped when unset)
+    REDIS_URL: Optional[str] = None
+
+    # Upstream Deadlines (seconds)
+    UPSTREAM_TIMEOUT_S: float = 8.0
+    RESOLVE_TIMEOUT_S: float = 90.0  # Resolvers poll the debrid API while a torrent is added
+    LLM_TIMEOUT_S: float = 30.0  # Max wait for Gemini's first / next streamed chunk
+
+    # Zilean Circuit Breaker: skip searches for a while after repeated failures
+    ZILEAN_BREAKER_FAILS: int = 5
+    ZILEAN_BREAKER_RESET_S: float = 30.0
+
+    # Answer with a canned reply, skipping the follow-up LLM call, when every
+    # tool in a chat turn failed or found nothing
+    VECTOR_SKIP_EMPTY_FOLLOW_UP: bool = False
+
+    # Log full tracebacks for unhandled MCP errors (may include request data)
+    DEBUG_TRACEBACKS: bool = False
+
     class Config:
         env_file = ".env"
 
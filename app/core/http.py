@@ -0,0 +1,15 @@
+import httpx
+
+# One pooled client per worker, shared by the upstream services so keep-alive
+# connections (and HTTP/2 multiplexing) are reused across requests.
+# Services pass their own per-call timeout where they need a different one.
+# Accept-Encoding is left to httpx: it offers every codec it can decode
+# (br / zstd too when the brotli / zstandard extras are installed).
+http_client = httpx.AsyncClient(
+    http2=True,
+    timeout=httpx.Timeout(10.0, connect=5.0),  # Fail fast on an unreachable host
+    limits=httpx.Limits(max_connections=1000, max_keepalive_connections=100, keepalive_expiry=60.0),
+)
+
+async def close_http_client():
+    await http_client.aclose()
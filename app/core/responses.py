@@ -0,0 +1,14 @@
+from typing import Any
+
+import orjson
+from starlette.responses import JSONResponse
+
+
+class ORJSONResponse(JSONResponse):
+    """
+    JSONResponse rendered with orjson (C extension) instead of the stdlib encoder.
+    FastAPI ships an equivalent class, but it is deprecated in recent releases.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content)
@@ -1,11 +1,30 @@
+import functools
 from abc import ABC, abstractmethod
 from typing import Optional, Dict
 
+def poll_delay(attempt: int, base: float = 0.1, factor: float = 1.5, cap: float = 2.0) -> float:
+    """
+    Exponential backoff for debrid status polling.
+    Cached torrents are usually ready within a few hundred ms, so start short
+    and only slow down to `cap` for torrents that really need time.
+    """
+    return min(base * factor ** attempt, cap)
+
+@functools.lru_cache(maxsize=1024)
+def _bearer_headers(api_key: str) -> Dict[str, str]:
+    return {"Authorization": f"Bearer {api_key}"}
+
 class DebridClient(ABC):
     """
     Abstract Base Class for Debrid Providers (TorBox, RealDebrid, etc.)
     """
     
+    def _get_headers(self, api_key: str) -> Dict[str, str]:
+        """
+        Auth headers for a user's key, built once per key and shared (read-only).
+        """
+        return _bearer_headers(api_key)
+
     @abstractmethod
     async def resolve_stream(
         self, 
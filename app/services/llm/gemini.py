@@ -1,114 +1,207 @@
+import asyncio
+import functools
+import orjson
 import google.generativeai as genai
+from google.generativeai import protos
+from google.ai.generativelanguage_v1beta import GenerativeServiceAsyncClient
 from google.ai.generativelanguage_v1beta.types import content
-from typing import List, Dict, Any
+from typing import AsyncIterator, List, Dict, Any, Optional, Tuple
 from loguru import logger
+from app.core.config import settings
 from .provider import LLMProvider, LLMResponse, ToolCall
 
+# Use Gemini 2.5 Flash for best RPM (15 RPM)
+MODEL_NAME = 'gemini-2.5-flash'
+
+ToolsSig = Tuple[Tuple[str, str, str], ...]
+
+def _tools_signature(tools: List[Dict[str, Any]]) -> ToolsSig:
+    """Hashable, order-stable fingerprint of a tool list."""
+    return tuple(
+        (t["name"], t["description"], orjson.dumps(t["inputSchema"], option=orjson.OPT_SORT_KEYS).decode())
+        for t in tools
+    )
+
+def _map_schema(schema: Dict[str, Any]) -> content.Schema:
+    """Converts a standard JSON Schema dict to a Gemini content.Schema object."""
+    type_str = schema.get("type", "string").lower()
+
+    type_map = {
+        "string": content.Type.STRING,
+        "number": content.Type.NUMBER, 
+        "integer": content.Type.INTEGER,
+        "boolean": content.Type.BOOLEAN,
+        "array": content.Type.ARRAY,
+        "object": content.Type.OBJECT
+    }
+
+    gemini_type = type_map.get(type_str, content.Type.STRING)
+
+    properties = {}
+    if "properties" in schema:
+        for key, prop_schema in schema["properties"].items():
+            properties[key] = _map_schema(prop_schema)
+
+    return content.Schema(
+        type=gemini_type,
+        description=schema.get("description"),
+        properties=properties or None,
+        required=schema.get("required"),
+        enum=schema.get("enum")
+    )
+
+@functools.lru_cache(maxsize=256)
+def _schema_from_json(schema_json: str) -> content.Schema:
+    """
+    _map_schema keyed by canonical schema JSON (from _tools_signature), so tool
+    sets that differ only by a few tools (e.g. with / without Trakt) reuse
+    the conversions they have in common.
+    """
+    return _map_schema(orjson.loads(schema_json))
+
+@functools.lru_cache(maxsize=16)
+def _build_model(api_key: str, tools_sig: ToolsSig) -> genai.GenerativeModel:
+    """
+    GenerativeModel (with its FunctionDeclaration protos) built once per key / tool set.
+    Each model gets its own client for its key: left alone, a model binds
+    whatever genai.configure() key is global when it first sends, which a
+    concurrent request for another user may have just set.
+    """
+    gemini_tools = None
+    if tools_sig:
+        gemini_tools = [content.Tool(function_declarations=[
+            content.FunctionDeclaration(
+                name=name,
+                description=description,
+                parameters=_schema_from_json(schema)
+            )
+            for name, description, schema in tools_sig
+        ])]
+    model = genai.GenerativeModel(MODEL_NAME, tools=gemini_tools)
+    model._async_client = GenerativeServiceAsyncClient(client_options={"api_key": api_key})
+    return model
+
+def _to_gemini_history(messages: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Any]]:
+    """
+    Converts conversation history to Gemini format, split into (history, active prompt parts).
+    Assistant turns with "tool_calls" become function_call parts, and "tool" results
+    become function_response parts (consecutive results share one turn, as Gemini expects).
+    """
+    gemini_history = []
+    for msg in messages:
+        role = msg["role"]
+        if role == "tool":
+            part = protos.Part(function_response=protos.FunctionResponse(
+                name=msg["name"], response={"result": msg["content"]}
+            ))
+            last = gemini_history[-1] if gemini_history else None
+            if last and last["role"] == "user" and last.get("function_responses"):
+                last["parts"].append(part)
+            else:
+                gemini_history.append({"role": "user", "parts": [part], "function_responses": True})
+        elif msg.get("tool_calls"):
+            parts = [msg["content"]] if msg.get("content") else []
+            parts.extend(
+                protos.Part(function_call=protos.FunctionCall(name=call["name"], args=call["arguments"]))
+                for call in msg["tool_calls"]
+            )
+            gemini_history.append({"role": "model", "parts": parts})
+        else:
+            gemini_history.append({"role": "user" if role == "user" else "model", "parts": [msg["content"]]})
+
+    # Separate the last user message as the active prompt
+    if gemini_history and gemini_history[-1]["role"] == "user":
+        prompt = gemini_history.pop()["parts"]
+    else:
+        prompt = ["Hello"] # Fallback
+    for entry in gemini_history:
+        entry.pop("function_responses", None)
+    return gemini_history, prompt
+
+def _parse_parts(parts) -> LLMResponse:
+    """Collects the text and function calls of a response (or of one streamed chunk)."""
+    text_parts = []
+    tool_calls = []
+
+    for part in parts:
+        text = part.text
+        if text:
+            text_parts.append(text)
+        fc = part.function_call
+        if fc:
+            # fc.args is already a mapping - copy it once into a plain dict
+            tool_calls.append(ToolCall(name=fc.name, arguments=dict(fc.args)))
+
+    return LLMResponse(content="".join(text_parts), tool_calls=tool_calls)
+
 class GeminiProvider(LLMProvider):
-    def __init__(self):
-        self.model = None
+    # Stateless: the key travels with each call, so concurrent users of the
+    # shared provider never see each other's credentials
 
     async def configure(self, api_key: str):
         if not api_key:
             logger.warning("Gemini Provider initialized without API Key")
             return
-        genai.configure(api_key=api_key)
-        # Use Gemini 2.5 Flash for best RPM (15 RPM)
-        self.model = genai.GenerativeModel('gemini-2.5-flash')
+        _build_model(api_key, ())  # Warm the key's plain model and client
 
     async def complete(
         self, 
-        messages: List[Dict[str, str]], 
-        tools: List[Dict[str, Any]] = []
+        messages: List[Dict[str, Any]], 
+        tools: List[Dict[str, Any]] = [],
+        api_key: Optional[str] = None
     ) -> LLMResponse:
-        if not self.model:
-            return LLMResponse(content="Error: Gemini AI not configured. Please set GEMINI_API_KEY in server environment.")
-
-        # Convert conversation history to Gemini format
-        gemini_history = []
-        for msg in messages:
-            role = "user" if msg["role"] == "user" else "model"
-            gemini_history.append({"role": role, "parts": [msg["content"]]})
-
-        # Separate the last user message as the active prompt
-        if gemini_history and gemini_history[-1]["role"] == "user":
-            last_message = gemini_history.pop()
-            prompt = last_message["parts"][0]
-        else:
-            prompt = "Hello" # Fallback
-
-        # Convert Tools to Gemini Function Declarations
-        gemini_tools = None
-        if tools:
-            formatted_tools = []
-            for t in tools:
-                formatted_tools.append(
-                     content.FunctionDeclaration(
-                         name=t["name"],
-                         description=t["description"],
-                         parameters=self._map_schema(t["inputSchema"])
-                     )
-                 )
-            
-            gemini_tools = content.Tool(function_declarations=formatted_tools)
+        """
+        Non-streaming form of complete_stream(): the same request, with the
+        chunks joined into one response.
+        """
+        text_parts = []
+        tool_calls = []
+        async for chunk in self.complete_stream(messages, tools, api_key):
+            text_parts.append(chunk.content)
+            tool_calls.extend(chunk.tool_calls)
+        return LLMResponse(content="".join(text_parts), tool_calls=tool_calls)
+
+    async def complete_stream(
+        self,
+        messages: List[Dict[str, Any]],
+        tools: List[Dict[str, Any]] = [],
+        api_key: Optional[str] = None
+    ) -> AsyncIterator[LLMResponse]:
+        if not api_key:
+            yield LLMResponse(content="Error: Gemini AI not configured. Please set GEMINI_API_KEY in server environment.")
+            return
+
+        gemini_history, prompt = _to_gemini_history(messages)
 
         try:
             # Create a chat session with history
-            chat = self.model.start_chat(history=gemini_history)
-            
-            # Send message
-            if gemini_tools:
-                # Re-instantiate model with tools if needed
-                chat = genai.GenerativeModel(
-                    'gemini-2.5-flash', 
-                    tools=[gemini_tools]
-                ).start_chat(history=gemini_history)
-
-            response = await chat.send_message_async(prompt)
-            
-            # Parse Response
-            text_content = ""
-            tool_calls = []
-
-            for part in response.parts:
-                if part.text:
-                    text_content += part.text
-                if part.function_call:
-                    fc = part.function_call
-                    # Convert args to dict protocol
-                    args = dict(fc.args.items()) 
-                    tool_calls.append(ToolCall(name=fc.name, arguments=args))
-
-            return LLMResponse(content=text_content, tool_calls=tool_calls)
+            # (models are cached per key / tool set, see _build_model)
+            model = _build_model(api_key, _tools_signature(tools) if tools else ())
+            chat = model.start_chat(history=gemini_history)
+
+            # A turn that answers tool results is asked for text only: the
+            # caller runs one round of tools per request
+            tool_config = None
+            if tools and messages and messages[-1]["role"] == "tool":
+                tool_config = {"function_calling_config": {"mode": "NONE"}}
+
+            # Chunks arrive as Gemini generates them; each one carries only the new parts.
+            # Every wait is bounded, so a stalled call can't hold the request forever.
+            response = await asyncio.wait_for(
+                chat.send_message_async(prompt, stream=True, tool_config=tool_config),
+                settings.LLM_TIMEOUT_S
+            )
+            chunks = response.__aiter__()
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), settings.LLM_TIMEOUT_S)
+                except StopAsyncIteration:
+                    break
+                yield _parse_parts(chunk.parts)
 
+        except asyncio.TimeoutError:
+            logger.error(f"Gemini Error: no response within {settings.LLM_TIMEOUT_S:.0f}s")
+            yield LLMResponse(content="Error: LLM timeout")
         except Exception as e:
             logger.error(f"Gemini Error: {e}")
-            return LLMResponse(content=f"Error connecting to AI: {str(e)}")
-
-    def _map_schema(self, schema: Dict[str, Any]) -> content.Schema:
-        """Converts a standard JSON Schema dict to a Gemini content.Schema object."""
-        type_str = schema.get("type", "string").lower()
-        
-        type_map = {
-            "string": content.Type.STRING,
-            "number": content.Type.NUMBER, 
-            "integer": content.Type.INTEGER,
-            "boolean": content.Type.BOOLEAN,
-            "array": content.Type.ARRAY,
-            "object": content.Type.OBJECT
-        }
-        
-        gemini_type = type_map.get(type_str, content.Type.STRING)
-        
-        properties = {}
-        if "properties" in schema:
-            for key, prop_schema in schema["properties"].items():
-                properties[key] = self._map_schema(prop_schema)
-                
-        return content.Schema(
-            type=gemini_type,
-            description=schema.get("description"),
-            properties=properties or None,
-            required=schema.get("required"),
-            enum=schema.get("enum")
-        )
+            yield LLMResponse(content=f"Error connecting to AI: {str(e)}")
@@ -1,4 +1,4 @@
-from typing import List, Dict, Any, Protocol
+from typing import AsyncIterator, List, Dict, Any, Optional, Protocol
 from pydantic import BaseModel
 
 class ToolCall(BaseModel):
@@ -16,11 +16,29 @@ class LLMProvider(Protocol):
 
     async def complete(
         self, 
-        messages: List[Dict[str, str]], 
-        tools: List[Dict[str, Any]] = []
+        messages: List[Dict[str, Any]], 
+        tools: List[Dict[str, Any]] = [],
+        api_key: Optional[str] = None
     ) -> LLMResponse:
         """
-        Send messages and available tools to the LLM.
+        Send messages and available tools to the LLM, authenticated with
+        `api_key` (passed per call, since one provider serves every user).
         Returns text content and/or tool call requests.
+
+        Messages are {"role", "content"} dicts. A tool round is an assistant
+        message with "tool_calls" (ToolCall dicts) followed by one
+        {"role": "tool", "name", "content"} message per call, in order.
+        """
+        ...
+
+    def complete_stream(
+        self,
+        messages: List[Dict[str, Any]],
+        tools: List[Dict[str, Any]] = [],
+        api_key: Optional[str] = None
+    ) -> AsyncIterator[LLMResponse]:
+        """
+        Streaming variant of complete(): yields partial responses
+        (text deltas and/or tool calls) as the LLM generates them.
         """
         ...
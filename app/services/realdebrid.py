@@ -1,10 +1,11 @@
 import httpx
 import asyncio
-import re
+import orjson
 from loguru import logger
 from typing import Optional, Dict
-from app.services.base import DebridClient
+from app.services.base import DebridClient, poll_delay
 from app.utils.parser import VideoParser
+from app.core.http import http_client
 
 class RealDebridService(DebridClient):
     """
@@ -13,28 +14,53 @@ class RealDebridService(DebridClient):
     """
     def __init__(self):
         self.base_url = "https://api.real-debrid.com/rest/1.0"
-        self.client = httpx.AsyncClient(timeout=30.0)
+        self.client = http_client
+        self.timeout = httpx.Timeout(30.0, connect=5.0)
 
-    async def _get_headers(self, api_key: str) -> Dict[str, str]:
-        return {"Authorization": f"Bearer {api_key}"}
-
-    async def _get_cached_file_ids(self, info_hash: str, api_key: str) -> Optional[set]:
+    async def _get_cached_files(self, info_hash: str, api_key: str) -> Optional[Dict[str, dict]]:
+        """
+        Instantly available files as {file_id: {"filename": ..., "filesize": ...}},
+        merged over all cached variants; None if the check failed or the hash isn't listed.
+        """
         try:
-            headers = await self._get_headers(api_key)
-            resp = await self.client.get(f"{self.base_url}/torrents/instantAvailability/{info_hash}", headers=headers)
+            headers = self._get_headers(api_key)
+            resp = await self.client.get(f"{self.base_url}/torrents/instantAvailability/{info_hash}", headers=headers, timeout=self.timeout)
             if resp.status_code == 200:
-                data = resp.json()
+                data = orjson.loads(resp.content)
                 # Structure: { hash: { "rd": [ {"1":{...}, "2":{...}}, ... ] } }
                 if info_hash.lower() in data:
                     rd_data = data[info_hash.lower()].get("rd", [])
-                    cached_ids = set()
+                    cached_files = {}
                     for variant in rd_data:
-                        cached_ids.update(variant.keys())
-                    return cached_ids
+                        cached_files.update(variant)
+                    return cached_files
         except Exception as e:
             logger.error(f"Error checking instant availability: {e}")
         return None
 
+    async def _poll_info(self, torrent_id: str, headers: Dict[str, str]) -> Optional[dict]:
+        """
+        Polls /torrents/info briefly until RD lists the torrent's files.
+        Returns the last info seen (possibly without files), or None.
+        """
+        target_torrent = None
+        for attempt in range(15):
+            info_resp = await self.client.get(f"{self.base_url}/torrents/info/{torrent_id}", headers=headers, timeout=self.timeout)
+            if info_resp.status_code == 200:
+                target_torrent = orjson.loads(info_resp.content)
+                status = target_torrent.get("status")
+                files = target_torrent.get("files", [])
+            
+                # "waiting_selection" means files are ready to be picked
+                # "downloaded" means it's done (if we selected all?)
+                if files:
+                    logger.info(f"RD Torrent Status: {status}, Files: {len(files)}")
+                    break
+        
+            if attempt < 14:
+                await asyncio.sleep(poll_delay(attempt))
+        return target_torrent
+
     async def resolve_stream(
         self, 
         source_id: str, 
@@ -59,28 +85,31 @@ class RealDebridService(DebridClient):
             logger.error("No RealDebrid API Key provided")
             return None
 
-        headers = await self._get_headers(api_key)
+        headers = self._get_headers(api_key)
         
         # 1. Check Instant Availability (Pre-Check)
         # We fetch this to ensure we only select files that are ACTUALLY cached.
-        cached_file_ids = await self._get_cached_file_ids(info_hash, api_key)
-        if cached_file_ids:
-            logger.info(f"Found {len(cached_file_ids)} instantly available file IDs for {info_hash}")
-        else:
-             logger.warning(f"No instant availability found for {info_hash}. Selection might trigger download.")
-
         # 2. Add Magnet
+        # The two calls are independent, so they share one round-trip.
         logger.info(f"Adding magnet to RD: {info_hash} (S{season}E{episode})")
         
         # RD 'addMagnet' takes 'magnet' form param
         magnet_link = magnet or f"magnet:?xt=urn:btih:{info_hash}"
-        resp = await self.client.post(f"{self.base_url}/torrents/addMagnet", data={"magnet": magnet_link}, headers=headers)
+        cached_files, resp = await asyncio.gather(
+            self._get_cached_files(info_hash, api_key),
+            self.client.post(f"{self.base_url}/torrents/addMagnet", data={"magnet": magnet_link}, headers=headers, timeout=self.timeout)
+        )
+        cached_file_ids = set(cached_files) if cached_files is not None else None
+        if cached_file_ids:
+            logger.info(f"Found {len(cached_file_ids)} instantly available file IDs for {info_hash}")
+        else:
+             logger.warning(f"No instant availability found for {info_hash}. Selection might trigger download.")
         
         if resp.status_code not in [200, 201]:
              logger.error(f"RD Add Failed: {resp.text}")
              return None
              
-        data = resp.json()
+        data = orjson.loads(resp.content)
         torrent_id = data.get("id")
         if not torrent_id:
              logger.error("RD did not return torrent ID")
@@ -92,21 +121,25 @@ class RealDebridService(DebridClient):
         selected_file_id = None
         target_torrent = None
         
-        # Poll briefly to get file list
-        for attempt in range(15):
-            info_resp = await self.client.get(f"{self.base_url}/torrents/info/{torrent_id}", headers=headers)
-            if info_resp.status_code == 200:
-                target_torrent = info_resp.json()
-                status = target_torrent.get("status")
-                files = target_torrent.get("files", [])
-                
-                # "waiting_selection" means files are ready to be picked
-                # "downloaded" means it's done (if we selected all?)
-                if files:
-                    logger.info(f"RD Torrent Status: {status}, Files: {len(files)}")
-                    break
-            
-            await asyncio.sleep(1.0)
+        # Set when the file list came from instant availability rather than RD's info
+        assumed_status = False
+        if cached_files:
+            # Instant availability already lists the cached files (id, name, size),
+            # which is all the selection below needs - skip the file-list poll.
+            # The status is assumed: a new magnet is usually waiting for its file
+            # selection, but may still be converting or already downloaded.
+            files = [
+                {"id": int(fid), "path": info.get("filename", ""), "bytes": info.get("filesize", 0)}
+                for fid, info in cached_files.items()
+                if str(fid).isdigit() and isinstance(info, dict)
+            ]
+            if files:
+                logger.info("Using instant availability file list, skipping RD info poll")
+                target_torrent = {"status": "waiting_files_selection", "files": files}
+                assumed_status = True
+        
+        if target_torrent is None:
+            target_torrent = await self._poll_info(torrent_id, headers)
             
         if not target_torrent:
             logger.error("Failed to get torrent info from RD")
@@ -120,18 +153,17 @@ class RealDebridService(DebridClient):
         # 3. Find Best File (Regex Match)
         # RD File Object: {'id': 1, 'path': '/...mkv', 'bytes': 1234, 'selected': 0}
         
-        video_files = [f for f in files if f.get("path", "").lower().endswith((".mp4", ".mkv", ".avi", ".mov", ".webm"))]
-        
-
-        if not video_files:
-            logger.error("No video files in RD torrent")
-            return None
-
-        # --- SCORE & FILTER FILES (Phase 2) ---
+        # --- CLASSIFY, SCORE & FILTER FILES (Phase 2, one pass) ---
+        video_files = []
         ranked_files = []
-        for f in video_files:
+        for f in files:
+            path = f.get("path", "")
+            if not VideoParser.is_video(path):
+                continue
+            video_files.append(f)
+
             score = VideoParser.score_file(
-                filename=f.get("path", ""), 
+                filename=path, 
                 size_bytes=f.get("bytes", 0),
                 exclude_hevc=exclude_hevc,
                 exclude_eac3=exclude_eac3,
@@ -151,6 +183,10 @@ class RealDebridService(DebridClient):
             if score > -900: 
                 f["_score"] = score
                 ranked_files.append(f)
+
+        if not video_files:
+            logger.error("No video files in RD torrent")
+            return None
         
         # Sort by Score Descending
         ranked_files.sort(key=lambda x: x["_score"], reverse=True)
@@ -169,25 +205,14 @@ class RealDebridService(DebridClient):
         if season is not None and episode is not None:
             logger.info(f"Looking for S{season:02d}E{episode:02d} in {len(video_files)} files...")
             
-            # Regex patterns for S01E01, 1x01, etc.
-            regex_list = [
-                rf"(?i)S{season:02d}E{episode:02d}",
-                rf"(?i)S{season}E{episode}",
-                rf"(?i){season}x{episode:02d}",
-                rf"(?i){season}x{episode}"
-            ]
-            
+            # Regex patterns for S01E01, 1x01, etc. (one pass over all paths)
             # Since video_files is already sorted by score (or size fallback),
             # the first match we find is the "Best" match.
-            for f in video_files:
-                fname = f.get("path", "")
-                for pat in regex_list:
-                    if re.search(pat, fname):
-                        best_file_id = f.get("id")
-                        logger.info(f"Selected RD file (Score: {f.get('_score', 'N/A')}): {f.get('path')}")
-                        break
-                if best_file_id:
-                    break
+            match_idx = VideoParser.first_episode_match([f.get("path", "") for f in video_files], season, episode)
+            if match_idx is not None:
+                f = video_files[match_idx]
+                best_file_id = f.get("id")
+                logger.info(f"Selected RD file (Score: {f.get('_score', 'N/A')}): {f.get('path')}")
             
             if not best_file_id:
                 logger.warning(f"No match for S{season}E{episode}. Fallback to highest scored file.")
@@ -206,8 +231,17 @@ class RealDebridService(DebridClient):
         # 4. Select File (if waiting selection)
         if target_torrent.get("status") == "waiting_files_selection":
             logger.info(f"Selecting file {best_file_id} on RD...")
-            sel_resp = await self.client.post(f"{self.base_url}/torrents/selectFiles/{torrent_id}", data={"files": str(best_file_id)}, headers=headers)
-            if sel_resp.status_code not in [200, 204]:
+            sel_resp = await self.client.post(f"{self.base_url}/torrents/selectFiles/{torrent_id}", data={"files": str(best_file_id)}, headers=headers, timeout=self.timeout)
+            if sel_resp.status_code not in [200, 202, 204] and assumed_status:  # 202: already selected
+                # The assumed status was wrong - read the real one and only
+                # select if RD is actually waiting for it
+                logger.info(f"RD Selection answered {sel_resp.status_code}, checking torrent status")
+                real_torrent = await self._poll_info(torrent_id, headers)
+                if real_torrent and real_torrent.get("status") == "waiting_files_selection":
+                    sel_resp = await self.client.post(f"{self.base_url}/torrents/selectFiles/{torrent_id}", data={"files": str(best_file_id)}, headers=headers, timeout=self.timeout)
+                elif real_torrent:
+                    sel_resp = None  # Nothing to select (e.g. already downloaded)
+            if sel_resp is not None and sel_resp.status_code not in [200, 202, 204]:
                  logger.error(f"RD Selection Failed: {sel_resp.text}")
                  return None
         
@@ -218,10 +252,10 @@ class RealDebridService(DebridClient):
         
         # Re-fetch info to get generated links
         final_link = None
-        for attempt in range(10):
-            info_resp = await self.client.get(f"{self.base_url}/torrents/info/{torrent_id}", headers=headers)
+        for attempt in range(12):  # ~11s of backoff, about the old 10 x 1s window
+            info_resp = await self.client.get(f"{self.base_url}/torrents/info/{torrent_id}", headers=headers, timeout=self.timeout)
             if info_resp.status_code == 200:
-                target_torrent = info_resp.json()
+                target_torrent = orjson.loads(info_resp.content)
                 status = target_torrent.get("status")
                 links = target_torrent.get("links", [])
                 
@@ -239,7 +273,8 @@ class RealDebridService(DebridClient):
                      logger.warning("Torrent is downloading (not cached). Cannot stream instantly.")
                      return None
             
-            await asyncio.sleep(1.0)
+            if attempt < 11:
+                await asyncio.sleep(poll_delay(attempt))
 
         if not final_link:
             logger.error("RD did not generate a download link (not cached?)")
@@ -247,12 +282,14 @@ class RealDebridService(DebridClient):
 
         # 6. Unrestrict the Link
         logger.info(f"Unrestricting link: {final_link}")
-        unrestrict_resp = await self.client.post(f"{self.base_url}/unrestrict/link", data={"link": final_link}, headers=headers)
+        unrestrict_resp = await self.client.post(f"{self.base_url}/unrestrict/link", data={"link": final_link}, headers=headers, timeout=self.timeout)
         
         if unrestrict_resp.status_code == 200:
-            unr_data = unrestrict_resp.json()
+            unr_data = orjson.loads(unrestrict_resp.content)
             stream_url = unr_data.get("download")
             return stream_url
         else:
             logger.error(f"RD Unrestrict Failed: {unrestrict_resp.text}")
             return None
+
+realdebrid_service = RealDebridService()
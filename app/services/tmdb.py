@@ -1,66 +1,93 @@
-import httpx
+import orjson
 from loguru import logger
 from typing import List, Optional, Dict, Any
 from async_lru import alru_cache
+from app.core.config import settings
+from app.core.http import http_client
+
+BASE_URL = "https://api.themoviedb.org/3"
+
+def _normalize(query: str) -> str:
+    """'The  Office ' and 'the office' are the same search."""
+    return " ".join(query.lower().split())
+
+@alru_cache(maxsize=1024, ttl=86400)
+async def _search_results(endpoint: str, api_key: str, query: str) -> List[Dict[str, Any]]:
+    """
+    First page of a TMDB search, shared by every TMDBService instance (the
+    vector chat builds one per call). Errors propagate so failures aren't cached.
+    Concurrent cold calls for the same key share one request (alru_cache
+    stores the in-flight future).
+    """
+    response = await http_client.get(
+        f"{BASE_URL}/search/{endpoint}",
+        params={"api_key": api_key, "query": query},
+        timeout=settings.UPSTREAM_TIMEOUT_S
+    )
+    response.raise_for_status()
+    return orjson.loads(response.content).get("results") or []
+
+def _show_info(top_result: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "tmdb_id": top_result["id"],
+        "title": top_result["name"],
+        "year": top_result.get("first_air_date", "")[:4] if top_result.get("first_air_date") else None,
+        "overview": top_result.get("overview", "")
+    }
+
+def _movie_info(top_result: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "tmdb_id": top_result["id"],
+        "title": top_result["title"],
+        "year": top_result.get("release_date", "")[:4] if top_result.get("release_date") else None,
+        "overview": top_result.get("overview", "")
+    }
 
 class TMDBService:
     def __init__(self, api_key: str = None):
         # TMDB API key - same one used by the Android app
         self.api_key = api_key or "16b81f36be6daedcf9500e2154e4cd4f"
-        self.base_url = "https://api.themoviedb.org/3"
-        self.client = httpx.AsyncClient(timeout=10.0)
+        self.base_url = BASE_URL
 
-    @alru_cache(maxsize=256)
     async def search_show(self, query: str) -> Optional[Dict[str, Any]]:
         """
         Search for a TV show and return the top result with TMDB ID.
         """
         try:
-            response = await self.client.get(
-                f"{self.base_url}/search/tv",
-                params={"api_key": self.api_key, "query": query}
-            )
-            response.raise_for_status()
-            data = response.json()
-            
-            if data.get("results"):
-                top_result = data["results"][0]
-                return {
-                    "tmdb_id": top_result["id"],
-                    "title": top_result["name"],
-                    "year": top_result.get("first_air_date", "")[:4] if top_result.get("first_air_date") else None,
-                    "overview": top_result.get("overview", "")
-                }
-            return None
+            results = await _search_results("tv", self.api_key, _normalize(query))
+            return _show_info(results[0]) if results else None
         except Exception as e:
             logger.error(f"TMDB TV search failed for '{query}': {e}")
             return None
 
-    @alru_cache(maxsize=256)
     async def search_movie(self, query: str) -> Optional[Dict[str, Any]]:
         """
         Search for a movie and return the top result with TMDB ID.
         """
         try:
-            response = await self.client.get(
-                f"{self.base_url}/search/movie",
-                params={"api_key": self.api_key, "query": query}
-            )
-            response.raise_for_status()
-            data = response.json()
-            
-            if data.get("results"):
-                top_result = data["results"][0]
-                return {
-                    "tmdb_id": top_result["id"],
-                    "title": top_result["title"],
-                    "year": top_result.get("release_date", "")[:4] if top_result.get("release_date") else None,
-                    "overview": top_result.get("overview", "")
-                }
-            return None
+            results = await _search_results("movie", self.api_key, _normalize(query))
+            return _movie_info(results[0]) if results else None
         except Exception as e:
             logger.error(f"TMDB movie search failed for '{query}': {e}")
             return None
 
+    async def search_any(self, query: str) -> Optional[Dict[str, Any]]:
+        """
+        Search TV and movies in one /search/multi request (for an unknown media
+        type) and return the top hit, tagged with "type" ("show" / "movie").
+        """
+        try:
+            results = await _search_results("multi", self.api_key, _normalize(query))
+            for item in results:
+                # multi also returns people; it is already ranked across types
+                if item.get("media_type") == "tv":
+                    return _show_info(item) | {"type": "show"}
+                if item.get("media_type") == "movie":
+                    return _movie_info(item) | {"type": "movie"}
+            return None
+        except Exception as e:
+            logger.error(f"TMDB multi search failed for '{query}': {e}")
+            return None
+
 # Singleton instance
 tmdb_service = TMDBService()
@@ -1,9 +1,15 @@
 import httpx
 import asyncio
+import time
+import orjson
 from loguru import logger
-from typing import Optional, Dict
+from typing import Optional, Dict, List, Hashable
+from cachetools import TTLCache
 from app.core.config import settings
-from app.services.base import DebridClient
+from app.services.base import DebridClient, poll_delay
+from app.core.http import http_client
+from app.core.cache import redis_memoize, singleflight
+from app.utils.parser import VideoParser
 
 class TorBoxService(DebridClient):
     """
@@ -12,20 +18,136 @@ class TorBoxService(DebridClient):
     """
     def __init__(self):
         self.base_url = "https://api.torbox.app/v1"
-        self.client = httpx.AsyncClient(timeout=20.0)
+        self.client = http_client
+        self.timeout = httpx.Timeout(20.0, connect=5.0)
+        # Tier 1: per-worker memory of resolved links. Resumes and repeat plays
+        # ask for the same hash/episode again, well inside a link's lifetime.
+        self._links: TTLCache = TTLCache(maxsize=2048, ttl=1800)
+        # One in-flight mylist GET per account, shared by every resolve polling it
+        self._mylist_inflight: Dict[Hashable, asyncio.Task] = {}
 
-    async def _get_headers(self, api_key: str) -> Dict[str, str]:
-        return {"Authorization": f"Bearer {api_key}"}
+    @staticmethod
+    def _next_poll_delay(resp: httpx.Response, torrent: Optional[dict], attempt: int) -> float:
+        """
+        Delay before the next mylist poll: the server's Retry-After when it sends
+        one, a short fixed step once TorBox reports the torrent cached/completed
+        (its files are about to appear), otherwise the usual backoff.
+        """
+        retry_after = resp.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+        if torrent and torrent.get("download_state") in ("cached", "completed"):
+            return 0.2
+        return poll_delay(attempt)
+
+    async def _fetch_mylist(self, api_key: str, torrent_id=None) -> httpx.Response:
+        """
+        The account's torrent list, or just one torrent's record when
+        `torrent_id` is given. Resolves running at the same time (e.g. a season
+        resumed episode by episode) poll the same thing, so concurrent callers
+        share a single GET and its response.
+        """
+        params = {"bypass_cache": "true"}
+        if torrent_id is not None:
+            params["id"] = torrent_id
+        return await singleflight(self._mylist_inflight, (api_key, torrent_id), lambda: self.client.get(
+            f"{self.base_url}/api/torrents/mylist",
+            params=params,
+            headers=self._get_headers(api_key),
+            timeout=self.timeout
+        ))
+
+    async def _get_mylist(self, api_key: str) -> Optional[httpx.Response]:
+        """
+        Speculative mylist fetch; None if it fails (the poll below still runs).
+        """
+        try:
+            return await self._fetch_mylist(api_key)
+        except httpx.HTTPError as e:
+            logger.warning(f"Early TorBox list fetch failed: {e}")
+            return None
+
+    @staticmethod
+    def _find_torrent(resp: Optional[httpx.Response], torrent_id) -> Optional[dict]:
+        """
+        The torrent with `torrent_id` from a mylist response (full list or
+        single record), if present.
+        """
+        if resp is None or resp.status_code != 200:
+            return None
+        list_data = orjson.loads(resp.content)
+        if not list_data.get("success"):
+            return None
+        torrents = list_data.get("data") or []
+        if isinstance(torrents, dict):
+            torrents = [torrents]  # Single-record (?id=) response
+        for t in torrents:
+            if str(t.get("id")) == str(torrent_id):
+                return t
+        return None
+
+    async def check_cached(self, api_key: str, info_hashes: List[str]) -> Dict[str, bool]:
+        """
+        Checks many hashes against the TorBox cache in a single request.
+        Returns {info_hash: cached}; hashes are expected lowercase.
+        """
+        if not info_hashes:
+            return {}
+
+        headers = self._get_headers(api_key)
+        resp = await self.client.get(
+            f"{self.base_url}/api/torrents/checkcached",
+            params={"hash": ",".join(info_hashes), "format": "object", "list_files": "false"},
+            headers=headers,
+            timeout=self.timeout
+        )
+        resp.raise_for_status()
+
+        data = orjson.loads(resp.content)
+        if not data.get("success"):
+            logger.error(f"TorBox Cache Check Error: {data.get('detail') or data.get('error')}")
+            return {}
+
+        cached = {h.lower() for h in (data.get("data") or {})}
+        return {h: h in cached for h in info_hashes}
 
     async def resolve_stream(self, source_id: str, info_hash: str, magnet: str, api_key: str, season: Optional[int] = None, episode: Optional[int] = None, exclude_hevc: bool = False, exclude_eac3: bool = False, exclude_dolby_vision: bool = False) -> Optional[str]:
         """
         Resolves a stream from TorBox by adding the magnet and selecting the correct file.
+        Memory (TTL) -> Redis (if configured) -> TorBox.
+        """
+        key = (api_key, (info_hash or "").lower(), season, episode, exclude_hevc, exclude_eac3, exclude_dolby_vision)
+        link = self._links.get(key)
+        if link is not None:
+            logger.info(f"TorBox link cache hit: {info_hash} (S{season}E{episode})")
+            return link
+
+        link = await self._resolve_cached(
+            source_id=source_id, info_hash=info_hash, magnet=magnet, api_key=api_key,
+            season=season, episode=episode, exclude_hevc=exclude_hevc,
+            exclude_eac3=exclude_eac3, exclude_dolby_vision=exclude_dolby_vision
+        )
+        if link:
+            self._links[key] = link
+        return link
+
+    # Every resolve adds the torrent to the user's paid TorBox account, so
+    # concurrent requests for the same hash/episode (across workers) share one
+    # resolution and the resulting link is reused for an hour. The API key is
+    # part of the hashed cache key, so links never cross accounts.
+    # The lock lasts as long as the caller's whole resolve budget, so it can't
+    # expire while the holder is still polling TorBox.
+    @redis_memoize(ttl=3600, prefix="torbox:resolve", lock_ms=int(settings.RESOLVE_TIMEOUT_S * 1000), lock_wait=settings.RESOLVE_TIMEOUT_S, poll_interval=0.1)
+    async def _resolve_cached(self, source_id: str, info_hash: str, magnet: str, api_key: str, season: Optional[int] = None, episode: Optional[int] = None, exclude_hevc: bool = False, exclude_eac3: bool = False, exclude_dolby_vision: bool = False) -> Optional[str]:
+        """
+        Cached TorBox resolution: add the torrent, pick the file, request the link.
+        Returns None (not cached) on failure.
         """
         if not api_key:
             logger.error("No TorBox API Key provided")
             return None
 
-        headers = await self._get_headers(api_key)
+        headers = self._get_headers(api_key)
         
         try:
             # 1. Add Torrent (Instant Check)
@@ -41,13 +163,18 @@ class TorBoxService(DebridClient):
             }
             
             # Use data= for form-encoded
-            resp = await self.client.post(f"{self.base_url}/api/torrents/createtorrent", data=add_payload, headers=headers)
+            # A hash the user has played before is usually already in their list
+            # with files, so fetch mylist alongside the create instead of after it
+            resp, early_list = await asyncio.gather(
+                self.client.post(f"{self.base_url}/api/torrents/createtorrent", data=add_payload, headers=headers, timeout=self.timeout),
+                self._get_mylist(api_key)
+            )
             
             if resp.status_code != 200:
                 logger.error(f"TorBox Add Failed: {resp.text}")
                 return None
                 
-            data = resp.json()
+            data = orjson.loads(resp.content)
             logger.info(f"TorBox Create Response: {data}")
 
             if not data.get("success"):
@@ -63,26 +190,34 @@ class TorBoxService(DebridClient):
                 return None
                 
             # 2. Get Torrent Info & Files
-            target_torrent = None
+            # If create response already gave us the files, use them!
+            if torrent_info.get("files"):
+                logger.info("TorBox returned files in create response, skipping list lookups")
+                target_torrent = torrent_info
+            else:
+                target_torrent = self._find_torrent(early_list, torrent_id)
+                if target_torrent and target_torrent.get("files"):
+                    logger.info(f"Torrent {torrent_id} already listed with files, skipping list polling")
+                else:
+                    target_torrent = None
             
             # If instant cache, we might get files immediately, but usually need to query list
             # Poll a few times for files to appear if needed
             # "checking" state can take a moment even if cached. Increase retries.
             max_retries = 30
-            for attempt in range(max_retries):
+            deadline = time.monotonic() + 45.0  # Wall-clock cap, whatever the delays add up to
+            for attempt in range(max_retries if target_torrent is None else 0):
                 # Log only every 5 attempts or first one to reduce spam
                 if attempt == 0 or (attempt + 1) % 5 == 0:
                      logger.info(f"Fetching TorBox list for ID: {torrent_id} (Attempt {attempt+1}/{max_retries})")
                 
-                list_resp = await self.client.get(f"{self.base_url}/api/torrents/mylist?bypass_cache=true", headers=headers)
+                # Poll just this torrent; the full list can be large for big libraries
+                list_resp = await self._fetch_mylist(api_key, torrent_id)
+                if list_resp.status_code not in (200, 429):
+                    list_resp = await self._fetch_mylist(api_key)
                 
                 if list_resp.status_code == 200:
-                    list_data = list_resp.json()
-                    if list_data.get("success"):
-                        for t in list_data.get("data", []):
-                            if str(t.get("id")) == str(torrent_id):
-                                target_torrent = t
-                                break
+                    target_torrent = self._find_torrent(list_resp, torrent_id) or target_torrent
                     
                     if target_torrent:
                         state = target_torrent.get("download_state")
@@ -98,7 +233,11 @@ class TorBoxService(DebridClient):
                             logger.warning("Torrent found but has no files (hydrating?). Waiting...")
                 
                 if attempt < max_retries - 1:
-                    await asyncio.sleep(2.0)
+                    delay = self._next_poll_delay(list_resp, target_torrent, attempt)
+                    if time.monotonic() + delay > deadline:
+                        logger.warning(f"Giving up on TorBox list for ID {torrent_id} after {attempt+1} attempts")
+                        break
+                    await asyncio.sleep(delay)
             
             if not target_torrent:
                 logger.error(f"Torrent {torrent_id} added but not found in list.")
@@ -111,7 +250,7 @@ class TorBoxService(DebridClient):
                  return None
 
             # Filter for video files
-            video_files = [f for f in files if f.get("name", "").lower().endswith((".mp4", ".mkv", ".avi", ".mov", ".webm"))]
+            video_files = [f for f in files if VideoParser.is_video(f.get("name", ""))]
             
             if not video_files:
                 logger.error("No video files found in torrent")
@@ -121,164 +260,32 @@ class TorBoxService(DebridClient):
             
             # SELECTION LOGIC: Season/Episode Matching
             if season is not None and episode is not None:
-                import re
                 logger.info(f"Looking for S{season:02d}E{episode:02d} in {len(video_files)} files...")
                 
                 # Regex patterns for S01E01, 1x01, etc.
-                # S01E01, S1E1, 1x01, 1x1
-                regex_list = [
-                    rf"(?i)S{season:02d}E{episode:02d}",
-                    rf"(?i)S{season}E{episode}",
-                    rf"(?i){season}x{episode:02d}",
-                    rf"(?i){season}x{episode}"
-                ]
-                
-                matches = []
-                for f in video_files:
-                    fname = f.get("name", "")
-                    for pat in regex_list:
-                        if re.search(pat, fname):
-                            matches.append(f)
-                            break
+                # S01E01, S1E1, 1x01, 1x1 - one cached, precompiled alternation
+                episode_re = VideoParser.episode_pattern(season, episode)
+                matches = [f for f in video_files if episode_re.search(f.get("name", ""))]
                 
                 if matches:
                     logger.info(f"Found {len(matches)} matching files for S{season}E{episode}")
                     # Pick largest matching file (highest quality)
-                    matches.sort(key=lambda x: x.get("size", 0), reverse=True)
-                    best_file_id = matches[0].get("id")
-                    logger.info(f"Selected file: {matches[0].get('name')}")
+                    best_file = max(matches, key=lambda x: x.get("size") or 0)
+                    best_file_id = best_file.get("id")
+                    logger.info(f"Selected file: {best_file.get('name')}")
                 else:
                     logger.warning(f"No file matched S{season}E{episode}. Fallback to largest file.")
             
             # Fallback / Default: Largest File
-            if not best_file_id:
-                video_files.sort(key=lambda x: x.get("size", 0), reverse=True)
-                best_file_id = video_files[0].get("id")
-                logger.info(f"Selected largest file (Fallback): {video_files[0].get('name')}")
+            if best_file_id is None:
+                best_file = max(video_files, key=lambda x: x.get("size") or 0)
+                best_file_id = best_file.get("id")
+                logger.info(f"Selected largest file (Fallback): {best_file.get('name')}")
             
-            if not best_file_id:
+            if best_file_id is None:
                  logger.warning("Could not determine best file ID")
                  return None
 
-            # 3. Request Download Link
-            try:
-                torrent_id_int = int(torrent_id)
-                file_id_int = int(best_file_id)
-            except (ValueError, TypeError):
-                logger.error(f"Invalid ID types - Torrent: {torrent_id}, File: {best_file_id}")
-                return None
-
-            link_payload = {
-                "token": api_key, 
-                "torrent_id": torrent_id_int, 
-                "file_id": file_id_int,
-                "zip_link": "false" 
-            }
-            # TorBox 'torrent/create' handles magnets/hashes.
-            # If cached, it's instant.
-            add_payload = {
-                "magnet": f"magnet:?xt=urn:btih:{info_hash}",
-                "seed": "1", 
-                "allow_zip": "false"
-            }
-            
-            # Use data= for form-encoded (multipart/form-data not strictly needed unless file upload, but form-urlencoded is safer)
-            resp = await self.client.post(f"{self.base_url}/api/torrents/createtorrent", data=add_payload, headers=headers)
-            
-            if resp.status_code != 200:
-                logger.error(f"TorBox Add Failed: {resp.text}")
-                return None
-                
-            data = resp.json()
-            logger.info(f"TorBox Create Response: {data}")
-
-            if not data.get("success"):
-                 logger.error(f"TorBox Add Error: {data}")
-                 return None
-            
-            # Check if 'data' block itself contains file info (sometimes it does)
-            torrent_info = data.get("data", {})
-            torrent_id = torrent_info.get("torrent_id") or torrent_info.get("id")
-            files_from_create = torrent_info.get("files") # Optimistic check
-
-            if not torrent_id:
-                logger.error("Could not determine Torrent ID from TorBox response")
-                return None
-            
-            target_torrent = None
-
-            # If create response already gave us the files, use them!
-            if files_from_create:
-                logger.info("TorBox returned files in create response, skipping list lookups")
-                target_torrent = torrent_info
-            else:
-                # 2. Get Torrent Info (fallback) with Retries
-                # Sometimes a "cached" torrent takes a moment to hydrate the files list (stuck in metaDL).
-                
-                for attempt in range(30):
-                    logger.info(f"Fetching TorBox list for ID: {torrent_id} (Attempt {attempt+1}/3)")
-                    
-                    info_resp = await self.client.get(f"{self.base_url}/api/torrents/mylist?bypass_cache=true", headers=headers)
-                    info_data = info_resp.json()
-                    
-                    # Log less to keep it clean, but enough to debug
-                    logger.info(f"TorBox MyList Success={info_data.get('success')}")
-                    
-                    if info_data.get("success"):
-                        for t in info_data.get("data", []):
-                            if str(t.get("id")) == str(torrent_id):
-                                target_torrent = t
-                                break
-                    
-                    if target_torrent:
-                        state = target_torrent.get("download_state")
-                        files = target_torrent.get("files") or []
-                        logger.info(f"Torrent State: {state}, Files: {len(files)}")
-                        
-                        if files:
-                            # We have files, we are good!
-                            break
-                        else:
-                            # Found torrent, but no files yet (metaDL?). Wait and retry.
-                            logger.warning("Torrent found but has no files (hydrating?). Waiting...")
-                    
-                    if attempt < 2:
-                        await asyncio.sleep(1.5)
-                        # Reset for next loop to force re-fetch
-                        target_torrent = None 
-            
-            if not target_torrent:
-                logger.error(f"Torrent {torrent_id} added but not found in list.")
-                return None
-                
-            # Find best file (largest video)
-            files = target_torrent.get("files") or []
-            best_file_id = None
-            
-            if not files:
-                 logger.error("No suitable files found in torrent (even after retries)")
-                 return None
-
-            # Debug: Log first file to check structure
-            if files:
-                logger.info(f"First file sample: {files[0]}")
-
-            # Sort by size desc
-            video_files = [f for f in files if f.get("name", "").lower().endswith((".mp4", ".mkv", ".avi", ".mov", ".webm"))]
-            
-            if video_files:
-                video_files.sort(key=lambda x: x.get("size", 0), reverse=True)
-                best_file_id = video_files[0].get("id")
-                if not best_file_id:
-                     logger.warning(f"Best video file missing ID: {video_files[0]}")
-            else:
-                 # Fallback to largest file period
-                 files.sort(key=lambda x: x.get("size", 0), reverse=True)
-                 if files:
-                     best_file_id = files[0].get("id")
-                     if not best_file_id:
-                         logger.warning(f"Fallback file missing ID: {files[0]}")
-
             # 3. Request Download Link
             # Ensure IDs are integers and token is passed if required by endpoint
             try:
@@ -295,15 +302,16 @@ class TorBoxService(DebridClient):
                 "zip_link": "false" 
             }
             
-            logger.info(f"Requesting DL with payload: {link_payload}")
+            logger.info(f"Requesting DL for torrent {torrent_id_int}, file {file_id_int}")
             
             link_resp = await self.client.get(
                 f"{self.base_url}/api/torrents/requestdl", 
                 params=link_payload, 
-                headers=headers
+                headers=headers,
+                timeout=self.timeout
             )
             
-            link_data = link_resp.json()
+            link_data = orjson.loads(link_resp.content)
             if link_data.get("success"):
                 return link_data.get("data")
             else:
@@ -1,6 +1,18 @@
-import httpx
-from typing import List, Dict, Any, Optional
+import asyncio
+import hashlib
+import itertools
+import orjson
+import time
+from typing import List, Dict, Any, Optional, Tuple
+from cachetools import TTLCache
 from loguru import logger
+from app.core.http import http_client
+
+# Watched lists per (token hash, kind): (fetched_at, etag, items, lowercased titles).
+# Fresh entries are served as-is; older ones are revalidated with If-None-Match,
+# so "did I watch X?" follow-ups cost a 304 rather than the whole list.
+_watched_cache: TTLCache = TTLCache(maxsize=1024, ttl=3600)
+_WATCHED_FRESH_S = 60.0
 
 class TraktService:
     """
@@ -21,20 +33,66 @@ class TraktService:
             "trakt-api-key": self.CLIENT_ID,
             "Authorization": f"Bearer {access_token}"
         }
+        # Shared pool: a service is built per chat turn, the connections aren't
+        self.client = http_client
+        # Cache key for this user's lists, without keeping the raw token around
+        self._token_key = hashlib.blake2b(access_token.encode(), digest_size=16).digest()
     
     async def get_watching_stats(self) -> Dict[str, Any]:
         """
         Get user's watching statistics.
         Returns aggregated data on total episodes, movies, time spent, etc.
         """
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{self.BASE_URL}/users/me/stats",
-                headers=self.headers,
+        response = await self.client.get(
+            f"{self.BASE_URL}/users/me/stats",
+            headers=self.headers,
+            timeout=10.0
+        )
+        response.raise_for_status()
+        return orjson.loads(response.content)
+    
+    async def _load_watched(self, kind: str) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """
+        One /users/me/watched/{kind} list ("movies" or "shows"), adapted to
+        history items, plus their lowercased titles in the same order.
+        Returns ([], []) on error.
+        """
+        item_key = kind[:-1]  # "movie" / "show"
+        cache_key = (self._token_key, kind)
+        entry: Optional[Tuple[float, Optional[str], List[Dict[str, Any]], List[str]]] = _watched_cache.get(cache_key)
+        if entry and time.monotonic() - entry[0] < _WATCHED_FRESH_S:
+            return entry[2], entry[3]
+
+        try:
+            headers = self.headers
+            if entry and entry[1]:
+                headers = {**self.headers, "If-None-Match": entry[1]}
+            response = await self.client.get(
+                f"{self.BASE_URL}/users/me/watched/{kind}",
+                headers=headers,
                 timeout=10.0
             )
-            response.raise_for_status()
-            return response.json()
+            if response.status_code == 304 and entry:
+                _, etag, items, titles = entry
+            else:
+                response.raise_for_status()
+                items = [
+                    {
+                        "type": item_key,
+                        item_key: item.get(item_key, {}),
+                        "plays": item.get("plays", 1),
+                        "last_watched_at": item.get("last_watched_at")
+                    }
+                    for item in orjson.loads(response.content)
+                ]
+                # Lowered once per fetch, not on every search
+                titles = [(item[item_key].get("title") or "").lower() for item in items]
+                etag = response.headers.get("ETag")
+            _watched_cache[cache_key] = (time.monotonic(), etag, items, titles)
+            return items, titles
+        except Exception as e:
+            logger.error(f"Error fetching watched {kind}: {e}")
+            return [], []
     
     async def get_history(self, limit: int = 100, item_type: Optional[str] = None) -> List[Dict[str, Any]]:
         """
@@ -42,48 +100,16 @@ class TraktService:
         This uses /watched endpoints instead of /history for better permission compatibility.
         Returns a combined list of watched shows and movies.
         """
-        results = []
+        kinds = []
+        if item_type in [None, "movies", "movie"]:
+            kinds.append("movies")
+        # Watched shows return show-level data, not episodes
+        if item_type in [None, "shows", "show"]:
+            kinds.append("shows")
         
-        async with httpx.AsyncClient() as client:
-            # Get watched movies
-            if item_type in [None, "movies", "movie"]:
-                try:
-                    response = await client.get(
-                        f"{self.BASE_URL}/users/me/watched/movies",
-                        headers=self.headers,
-                        timeout=10.0
-                    )
-                    response.raise_for_status()
-                    movies = response.json()
-                    for movie in movies[:limit]:
-                        results.append({
-                            "type": "movie",
-                            "movie": movie.get("movie", {}),
-                            "plays": movie.get("plays", 1),
-                            "last_watched_at": movie.get("last_watched_at")
-                        })
-                except Exception as e:
-                    logger.error(f"Error fetching watched movies: {e}")
-            
-            # Get watched shows (returns show-level data, not episodes)
-            if item_type in [None, "shows", "show"]:
-                try:
-                    response = await client.get(
-                        f"{self.BASE_URL}/users/me/watched/shows",
-                        headers=self.headers,
-                        timeout=10.0
-                    )
-                    response.raise_for_status()
-                    shows = response.json()
-                    for show in shows[:limit]:
-                        results.append({
-                            "type": "show",
-                            "show": show.get("show", {}),
-                            "plays": show.get("plays", 1),
-                            "last_watched_at": show.get("last_watched_at")
-                        })
-                except Exception as e:
-                    logger.error(f"Error fetching watched shows: {e}")
+        # Both lists in parallel; each endpoint fails on its own
+        watched = await asyncio.gather(*(self._load_watched(kind) for kind in kinds))
+        results = [item for items, _ in watched for item in items[:limit]]
         
         return results[:limit]
     
@@ -92,21 +118,14 @@ class TraktService:
         Search the user's watched content for a specific title.
         Uses /watched endpoints instead of /history for compatibility.
         """
-        history = await self.get_history(limit=1000)  # Get large sample
-        results = []
+        watched = await asyncio.gather(self._load_watched("movies"), self._load_watched("shows"))
+        # Same large sample as get_history(limit=1000), matched on the prebuilt titles
+        indexed = itertools.islice(
+            itertools.chain.from_iterable(zip(titles, items) for items, titles in watched), 1000
+        )
         
         title_lower = title.lower()
-        for item in history:
-            if item.get("type") == "movie":
-                movie_title = item.get("movie", {}).get("title", "").lower()
-                if title_lower in movie_title:
-                    results.append(item)
-            elif item.get("type") == "show":
-                show_title = item.get("show", {}).get("title", "").lower()
-                if title_lower in show_title:
-                    results.append(item)
-        
-        return results
+        return [item for item_title, item in indexed if title_lower in item_title]
     
     async def get_continue_watching(self) -> List[Dict[str, Any]]:
         """
@@ -115,39 +134,37 @@ class TraktService:
         """
         # Trakt doesn't have a native "Continue Watching" endpoint
         # We simulate it by getting recently watched shows that are incomplete
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{self.BASE_URL}/users/me/watching",
+        response = await self.client.get(
+            f"{self.BASE_URL}/users/me/watching",
+            headers=self.headers,
+            timeout=10.0
+        )
+        
+        if response.status_code == 204:  # No Content (not currently watching)
+            # Fallback: Get progress for shows
+            progress_response = await self.client.get(
+                f"{self.BASE_URL}/users/me/watched/shows",
                 headers=self.headers,
                 timeout=10.0
             )
-            
-            if response.status_code == 204:  # No Content (not currently watching)
-                # Fallback: Get progress for shows
-                progress_response = await client.get(
-                    f"{self.BASE_URL}/users/me/watched/shows",
-                    headers=self.headers,
-                    timeout=10.0
-                )
-                progress_response.raise_for_status()
-                return progress_response.json()
-            
-            response.raise_for_status()
-            return [response.json()]  # Single item if actively watching
+            progress_response.raise_for_status()
+            return orjson.loads(progress_response.content)
+        
+        response.raise_for_status()
+        return [orjson.loads(response.content)]  # Single item if actively watching
     
     async def get_calendar(self, days: int = 7) -> List[Dict[str, Any]]:
         """
         Get upcoming episodes for shows the user watches.
         """
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{self.BASE_URL}/calendars/my/shows",
-                headers=self.headers,
-                params={"days": days},
-                timeout=10.0
-            )
-            response.raise_for_status()
-            return response.json()
+        response = await self.client.get(
+            f"{self.BASE_URL}/calendars/my/shows",
+            headers=self.headers,
+            params={"days": days},
+            timeout=10.0
+        )
+        response.raise_for_status()
+        return orjson.loads(response.content)
     
     async def get_favorite_genres(self) -> List[str]:
         """
@@ -1,8 +1,11 @@
-from typing import List, Dict, Any, Optional
+import asyncio
+import textwrap
+import orjson
+from typing import AsyncIterator, List, Dict, Any, Optional, Tuple
 from loguru import logger
 from app.core.config import settings
 from app.services.llm.gemini import GeminiProvider
-from app.services.llm.provider import LLMProvider
+from app.services.llm.provider import LLMProvider, ToolCall
 
 # Import tools for direct execution
 # In a larger system, we'd have a ToolRegistry
@@ -14,269 +17,376 @@ from app.services.llm.provider import LLMProvider
 
 from app.services.zilean import zilean_service
 from app.services.torbox import torbox_service
-from app.services.trakt import create_trakt_service
+from app.services.trakt import TraktService, create_trakt_service
 from app.services.tmdb import tmdb_service
 
+# Define Available Tools (Schema)
+# This mirrors what we send in 'tools/list' but is internal for the LLM prompt
+# Tools available to the AI
+_BASE_TOOLS: List[Dict[str, Any]] = [
+    {
+        "name": "tmdb_search",
+        "description": "Search TMDB to get accurate TMDB IDs for movies or TV shows. ALWAYS use this for recommendations!",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "query": {"type": "string", "description": "Title to search for"},
+                "type": {"type": "string", "enum": ["movie", "show"], "description": "Content type (omit if unsure to search both)"}
+            },
+            "required": ["query"]
+        }
+    },
+    {
+        "name": "search",
+        "description": "Search for streams. Use only if you need to find available torrents.",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "query": {"type": "string"},
+                "type": {"type": "string", "enum": ["movie", "show"]}
+            },
+            "required": ["query"]
+        }
+    }
+]
+
+# Added to the schema when the request carries a Trakt token
+_TRAKT_TOOLS: List[Dict[str, Any]] = [
+    {
+        "name": "trakt_stats",
+        "description": "Get the user's Trakt watching statistics (total episodes, movies, time spent, etc.)",
+        "inputSchema": {
+            "type": "object",
+            "properties": {}
+        }
+    },
+    {
+        "name": "trakt_history_search",
+        "description": "Search the user's entire watch history for a specific title. Useful for 'Did I watch X?' questions.",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "title": {"type": "string", "description": "Title to search for"}
+            },
+            "required": ["title"]
+        }
+    },
+    {
+        "name": "trakt_continue_watching",
+        "description": "Get shows/movies the user is currently watching (Continue Watching list)",
+        "inputSchema": {
+            "type": "object",
+            "properties": {}
+        }
+    }
+]
+
+# Full tool set for requests with a Trakt token (one list, not a per-request concat)
+_ALL_TOOLS: List[Dict[str, Any]] = _BASE_TOOLS + _TRAKT_TOOLS
+
+# Most recent history messages sent with a query (12 user/assistant turns)
+_MAX_HISTORY_MESSAGES = 24
+
+# Longest tool output fed back to the model, in characters
+_TOOL_RESULT_MAX_CHARS = 500
+
+# System Prompt
+_SYSTEM_PROMPT = """
+You are VECTOR, the intelligent core of the VOID streaming platform.
+Your mission is to discover, recommend, and manage content.
+
+### IDENTITY & PERSONA
+- **Voice**: Cinematic, Enthusiastic, Knowledgeable, Concisely Witty.
+- **Role**: You are a Film Expert and TV Buff. You possess vast internal knowledge of media. Use it freely to make recommendations.
+- **Tone**: "Visuals First". prioritized getting the user to the content.
+
+### OPS: DEEP LINKING (MANDATORY)
+You MUST enable one-click playback for every movie or TV show you mention.
+
+**Execution Chain:**
+1. **Ideate**: Use your internal knowledge to suggest titles based on user requests.
+2. **Verify**: CALL `tmdb_search(query=Title, type=media_type)` to get the official TMDB ID for each suggestion.
+3. **Link**: RENDER the link as: `[Title](void://<type>/<tmdb_id>)`.
+
+**CRITICAL:** You MUST verify every link with `tmdb_search` to ensure the ID is correct. Do not guess IDs.
+"""
+
+async def _tool_tmdb_search(args: Dict[str, Any], trakt: Optional[TraktService], tmdb_api_key: Optional[str]) -> Dict[str, str]:
+    """TMDB lookup for an official ID (type: show / movie / omitted for both)."""
+    # Execute TMDB Search
+    query = args.get("query")
+    content_type = args.get("type")  # None: let TMDB decide
+    logger.info("Executing tmdb_search: {} (type={})", query, content_type)
+
+    try:
+        # Use client's TMDB API key if provided, otherwise fall back to default
+        from app.services.tmdb import TMDBService
+        tmdb = TMDBService(api_key=tmdb_api_key)
+
+        if content_type == "show":
+            result = await tmdb.search_show(query)
+        elif content_type is None:
+            result = await tmdb.search_any(query)
+        else:
+            result = await tmdb.search_movie(query)
+
+        if result:
+            return {
+                "tool": "tmdb_search",
+                "result": f"TMDB ID: {result['tmdb_id']}, Title: {result['title']}, Year: {result.get('year', 'N/A')}, Type: {result.get('type', content_type)}"
+            }
+        else:
+            return {
+                "tool": "tmdb_search",
+                "result": f"No results found for '{query}'"
+            }
+    except Exception as e:
+        logger.error("TMDB search error: {}", e)
+        return {
+            "tool": "tmdb_search",
+            "result": f"Error searching TMDB: {str(e)}"
+        }
+
+async def _tool_search(args: Dict[str, Any], trakt: Optional[TraktService], tmdb_api_key: Optional[str]) -> Dict[str, str]:
+    """Zilean stream search, summarized to the top five results."""
+    # Execute Search
+    logger.info("Executing Search: {}", args)
+
+    q = args.get("query")
+    t = args.get("type", "movie")
+
+    # Call Zilean (Reusing logic from mcp.py would be ideal, but for now duplicate/call service directly)
+    # Simple title search for now
+    results = await zilean_service.search_stream(title=q)
+
+    # Simplify results for LLM consumption (don't send 1000 lines of JSON)
+    summary = [f"{r.get('raw_title')} ({r.get('size')})" for r in results[:5]]
+    return {
+        "tool": "search",
+        "result": f"Found {len(results)} results. Top 5: {', '.join(summary)}"
+    }
+
+async def _tool_trakt_stats(args: Dict[str, Any], trakt: Optional[TraktService], tmdb_api_key: Optional[str]) -> Dict[str, str]:
+    """Totals from the user's Trakt stats."""
+    logger.info("Executing trakt_stats")
+    try:
+        stats = await trakt.get_watching_stats()
+        # Format stats for AI
+        movies_watched = stats.get("movies", {}).get("watched", 0)
+        episodes_watched = stats.get("episodes", {}).get("watched", 0)
+        minutes_watched = stats.get("minutes", 0)
+        hours = minutes_watched // 60
+
+        result_text = f"User has watched {movies_watched} movies and {episodes_watched} episodes. Total time: {hours} hours."
+        return {"tool": "trakt_stats", "result": result_text}
+    except Exception as e:
+        logger.error("Trakt stats error: {}", e)
+        return {"tool": "trakt_stats", "result": f"Error fetching stats: {str(e)}"}
+
+async def _tool_trakt_history_search(args: Dict[str, Any], trakt: Optional[TraktService], tmdb_api_key: Optional[str]) -> Dict[str, str]:
+    """Whether the user has watched a title, from their Trakt watched lists."""
+    title = args.get("title", "")
+    logger.info("Executing trakt_history_search for: {}", title)
+
+    try:
+        results = await trakt.search_history(title)
+        if results:
+            result_text = f"Yes, user watched '{title}'. Found {len(results)} occurrences in history."
+        else:
+            result_text = f"No, user has not watched '{title}'."
+        return {"tool": "trakt_history_search", "result": result_text}
+    except Exception as e:
+        logger.error("Trakt history search error: {}", e)
+        return {"tool": "trakt_history_search", "result": f"Error searching history: {str(e)}"}
+
+async def _tool_trakt_continue_watching(args: Dict[str, Any], trakt: Optional[TraktService], tmdb_api_key: Optional[str]) -> Dict[str, str]:
+    """Up to five titles the user is watching on Trakt."""
+    logger.info("Executing trakt_continue_watching")
+    try:
+        items = await trakt.get_continue_watching()
+        if items:
+            summaries = []
+            for item in items[:5]:  # Top 5
+                title = item.get("show", {}).get("title") or item.get("movie", {}).get("title", "Unknown")
+                summaries.append(title)
+            result_text = f"User is currently watching: {', '.join(summaries)}"
+        else:
+            result_text = "No shows currently in progress."
+        return {"tool": "trakt_continue_watching", "result": result_text}
+    except Exception as e:
+        logger.error("Trakt continue watching error: {}", e)
+        return {"tool": "trakt_continue_watching", "result": f"Error fetching continue watching: {str(e)}"}
+
+# Tool name -> handler. Handlers take the call's arguments plus the per-turn
+# context and return a {"tool", "result"} output.
+TOOL_HANDLERS = {
+    "tmdb_search": _tool_tmdb_search,
+    "search": _tool_search,
+    "trakt_stats": _tool_trakt_stats,
+    "trakt_history_search": _tool_trakt_history_search,
+    "trakt_continue_watching": _tool_trakt_continue_watching,
+}
+
+# Only offered (and run) when the request carries a Trakt token
+_TRAKT_TOOL_NAMES = frozenset(t["name"] for t in _TRAKT_TOOLS)
+
+# Tool results that carry no information for the answer (errors, empty searches)
+_EMPTY_RESULT_PREFIXES = ("Error", "No results found", "Found 0 results", "Tool '")
+_NOTHING_FOUND_REPLY = "I couldn't find anything for that - want to try a different title?"
+
+def _only_empty_results(tool_messages: List[Dict[str, Any]]) -> bool:
+    """True if every tool result just produced is an error or an empty search."""
+    return bool(tool_messages) and all(m["content"].startswith(_EMPTY_RESULT_PREFIXES) for m in tool_messages)
+
 class VectorService:
     def __init__(self):
         # We can default to Gemini for now, but design allows swapping
         self.provider: LLMProvider = GeminiProvider()
         self.initialized = False
 
-    async def initialize(self, api_key: Optional[str] = None):
-        # Priority: Client Key > Env Key
+    async def initialize(self, api_key: Optional[str] = None) -> Optional[str]:
+        """
+        Returns the Gemini key for this request. Priority: Client Key > Env Key.
+        The key is passed to every provider call rather than stored on the
+        shared provider, so concurrent users never swap credentials.
+        """
         final_key = api_key or settings.GEMINI_API_KEY
-        
-        # Re-configure if key changes or not initialized
-        # Note: In a real multi-user env, we shouldn't re-configure a global singleton.
-        # We should instantiate a provider per request or pass auth context to the provider.
-        # For simplicity here, we re-configure (assuming single user or low concurrency for prototype).
         if final_key:
              await self.provider.configure(final_key)
              self.initialized = True
+        return final_key
 
-    async def chat(self, query: str, history: List[Dict[str, str]] = [], api_key: Optional[str] = None, user_context: Optional[str] = None, trakt_token: Optional[str] = None, tmdb_api_key: Optional[str] = None) -> str:
+    async def chat(self, query: str, history: Optional[List[Dict[str, str]]] = None, api_key: Optional[str] = None, user_context: Optional[str] = None, trakt_token: Optional[str] = None, tmdb_api_key: Optional[str] = None) -> str:
         """
         Process a chat query using the LLM Provider and available tools.
         """
-        await self.initialize(api_key)
-
-        # Define Available Tools (Schema)
-        # This mirrors what we send in 'tools/list' but is internal for the LLM prompt
-        # Tools available to the AI
-        tools_schema = [
-            {
-                "name": "tmdb_search",
-                "description": "Search TMDB to get accurate TMDB IDs for movies or TV shows. ALWAYS use this for recommendations!",
-                "inputSchema": {
-                    "type": "object",
-                    "properties": {
-                        "query": {"type": "string", "description": "Title to search for"},
-                        "type": {"type": "string", "enum": ["movie", "show"], "description": "Content type"}
-                    },
-                    "required": ["query", "type"]
-                }
-            },
-            {
-                "name": "search",
-                "description": "Search for streams. Use only if you need to find available torrents.",
-                "inputSchema": {
-                    "type": "object",
-                    "properties": {
-                        "query": {"type": "string"},
-                        "type": {"type": "string", "enum": ["movie", "show"]}
-                    },
-                    "required": ["query"]
-                }
-            }
-        ]
+        api_key = await self.initialize(api_key)
+        current_messages, tools_schema = self._build_request(query, history, user_context, trakt_token)
+
+        # 1. First Call to LLM
+        response = await self.provider.complete(current_messages, tools=tools_schema, api_key=api_key)
         
-        # Add Trakt tools if token is available
-        if trakt_token:
-            tools_schema.extend([
-                {
-                    "name": "trakt_stats",
-                    "description": "Get the user's Trakt watching statistics (total episodes, movies, time spent, etc.)",
-                    "inputSchema": {
-                        "type": "object",
-                        "properties": {}
-                    }
-                },
-                {
-                    "name": "trakt_history_search",
-                    "description": "Search the user's entire watch history for a specific title. Useful for 'Did I watch X?' questions.",
-                    "inputSchema": {
-                        "type": "object",
-                        "properties": {
-                            "title": {"type": "string", "description": "Title to search for"}
-                        },
-                        "required": ["title"]
-                    }
-                },
-                {
-                    "name": "trakt_continue_watching",
-                    "description": "Get shows/movies the user is currently watching (Continue Watching list)",
-                    "inputSchema": {
-                        "type": "object",
-                        "properties": {}
-                    }
-                }
-            ])
-
-        # System Prompt
-        system_prompt = """
-        You are VECTOR, the intelligent core of the VOID streaming platform.
-        Your mission is to discover, recommend, and manage content.
-
-        ### IDENTITY & PERSONA
-        - **Voice**: Cinematic, Enthusiastic, Knowledgeable, Concisely Witty.
-        - **Role**: You are a Film Expert and TV Buff. You possess vast internal knowledge of media. Use it freely to make recommendations.
-        - **Tone**: "Visuals First". prioritized getting the user to the content.
-
-        ### OPS: DEEP LINKING (MANDATORY)
-        You MUST enable one-click playback for every movie or TV show you mention.
-
-        **Execution Chain:**
-        1. **Ideate**: Use your internal knowledge to suggest titles based on user requests.
-        2. **Verify**: CALL `tmdb_search(query=Title, type=media_type)` to get the official TMDB ID for each suggestion.
-        3. **Link**: RENDER the link as: `[Title](void://<type>/<tmdb_id>)`.
-
-        **CRITICAL:** You MUST verify every link with `tmdb_search` to ensure the ID is correct. Do not guess IDs.
+        # 2. Check for Tool Calls
+        if response.tool_calls:
+            logger.info("AI requested tool calls: {}", response.tool_calls)
+            follow_up_messages, tool_messages = await self._run_tools(current_messages, response.tool_calls, trakt_token, tmdb_api_key)
+            if settings.VECTOR_SKIP_EMPTY_FOLLOW_UP and _only_empty_results(tool_messages):
+                return _NOTHING_FOUND_REPLY
+            final_response = await self.provider.complete(follow_up_messages, tools=tools_schema, api_key=api_key)
+            return final_response.content
+
+        return response.content
+
+    async def chat_stream(self, query: str, history: Optional[List[Dict[str, str]]] = None, api_key: Optional[str] = None, user_context: Optional[str] = None, trakt_token: Optional[str] = None, tmdb_api_key: Optional[str] = None) -> AsyncIterator[str]:
+        """
+        Same as chat(), but yields the answer text as the model generates it.
+        Text from the first turn is yielded right away; if the model asks for
+        tools, they run once the turn ends and the follow-up answer is streamed.
+        """
+        api_key = await self.initialize(api_key)
+        current_messages, tools_schema = self._build_request(query, history, user_context, trakt_token)
+
+        tool_calls: List[ToolCall] = []
+        async for chunk in self.provider.complete_stream(current_messages, tools=tools_schema, api_key=api_key):
+            tool_calls.extend(chunk.tool_calls)
+            if chunk.content:
+                yield chunk.content
+
+        if tool_calls:
+            logger.info("AI requested tool calls: {}", tool_calls)
+            follow_up_messages, tool_messages = await self._run_tools(current_messages, tool_calls, trakt_token, tmdb_api_key)
+            if settings.VECTOR_SKIP_EMPTY_FOLLOW_UP and _only_empty_results(tool_messages):
+                yield _NOTHING_FOUND_REPLY
+                return
+            async for chunk in self.provider.complete_stream(follow_up_messages, tools=tools_schema, api_key=api_key):
+                if chunk.content:
+                    yield chunk.content
+
+    def _build_request(self, query: str, history: Optional[List[Dict[str, str]]], user_context: Optional[str], trakt_token: Optional[str]) -> Tuple[List[Dict[str, str]], List[Dict[str, Any]]]:
         """
+        Builds the first-turn messages (system prompt + history + query) and the tool schema.
+        """
+        # Static prefix (prompt + tool schema) is built once at import, so every
+        # request starts with byte-identical tokens Gemini can reuse
+        tools_schema = _ALL_TOOLS if trakt_token else _BASE_TOOLS
 
         # Inject User Context if provided
         final_query = query
         if user_context:
             final_query = f"{query}\n\n[Active User Context]\n{user_context}"
 
-        # 1. First Call to LLM
         # We append the new user query to history
         # We also prepend the System Prompt
-        current_messages = [{"role": "system", "content": system_prompt}] + history + [{"role": "user", "content": final_query}]
+        # Only the most recent turns are replayed, so prefill stays bounded in long chats
+        recent_history = (history or [])[-_MAX_HISTORY_MESSAGES:]
+        current_messages = [{"role": "system", "content": _SYSTEM_PROMPT}] + recent_history + [{"role": "user", "content": final_query}]
+        return current_messages, tools_schema
+
+    async def _dispatch_tool(self, tool: ToolCall, trakt: Optional[TraktService], tmdb_api_key: Optional[str]) -> Optional[Dict[str, str]]:
+        """
+        Runs one tool call and returns its {"tool", "result"} output, or None for
+        tools that aren't available (unknown name, or Trakt without a token).
+        """
+        handler = TOOL_HANDLERS.get(tool.name)
+        if handler is None or (tool.name in _TRAKT_TOOL_NAMES and trakt is None):
+            return None
+        return await handler(tool.arguments, trakt, tmdb_api_key)
+
+    async def _run_tools(self, current_messages: List[Dict[str, str]], tool_calls: List[ToolCall], trakt_token: Optional[str], tmdb_api_key: Optional[str]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        Executes the requested tools and returns the follow-up messages for the
+        final answer, plus just this turn's tool result messages.
+        """
+        # Execute Tools
+        # Create a new history entry for the Model's tool request?
+        # Gemini handles this via function calling history. 
+        # Ideally `complete` handles the turn if we were using a persisted session object.
+        # Since we are stateless HTTP, we need to manually reconstruct the conversation flow 
+        # if we want to support multi-turn tool use in one request?
+        # Usually: User -> Model(Call Tool) -> Sys(Result) -> Model(Final Answer)
         
-        response = await self.provider.complete(current_messages, tools=tools_schema)
+        # For this MVP, we do one loop.
+        # Tools are independent lookups (TMDB, Zilean, Trakt), so they run concurrently;
+        # results keep the order the model asked for them in
+        trakt = create_trakt_service(trakt_token) if trakt_token else None
+
+        # The model sometimes repeats a call verbatim (same name and arguments);
+        # each distinct call runs once and its output is reused for the repeats
+        call_keys = [
+            (tool.name, orjson.dumps(tool.arguments, option=orjson.OPT_SORT_KEYS, default=str))
+            for tool in tool_calls
+        ]
+        distinct = dict(zip(call_keys, tool_calls))
+        distinct_outputs = await asyncio.gather(
+            *(self._dispatch_tool(tool, trakt, tmdb_api_key) for tool in distinct.values()),
+            return_exceptions=True
+        )
+        output_by_key = dict(zip(distinct, distinct_outputs))
+        outputs = [output_by_key[key] for key in call_keys]
         
-        # 2. Check for Tool Calls
-        if response.tool_calls:
-            logger.info(f"AI requested tool calls: {response.tool_calls}")
-            
-            # Execute Tools
-            # Create a new history entry for the Model's tool request?
-            # Gemini handles this via function calling history. 
-            # Ideally `complete` handles the turn if we were using a persisted session object.
-            # Since we are stateless HTTP, we need to manually reconstruct the conversation flow 
-            # if we want to support multi-turn tool use in one request?
-            # Usually: User -> Model(Call Tool) -> Sys(Result) -> Model(Final Answer)
-            
-            # For this MVP, we do one loop.
-            tool_outputs = []
-            
-            for tool in response.tool_calls:
-                if tool.name == "tmdb_search":
-                    # Execute TMDB Search
-                    args = tool.arguments
-                    query = args.get("query")
-                    content_type = args.get("type", "show")
-                    logger.info(f"Executing tmdb_search: {query} (type={content_type})")
-                    
-                    try:
-                        # Use client's TMDB API key if provided, otherwise fall back to default
-                        from app.services.tmdb import TMDBService
-                        tmdb = TMDBService(api_key=tmdb_api_key)
-                        
-                        if content_type == "show":
-                            result = await tmdb.search_show(query)
-                        else:
-                            result = await tmdb.search_movie(query)
-                        
-                        if result:
-                            tool_outputs.append({
-                                "tool": "tmdb_search",
-                                "result": f"TMDB ID: {result['tmdb_id']}, Title: {result['title']}, Year: {result.get('year', 'N/A')}"
-                            })
-                        else:
-                            tool_outputs.append({
-                                "tool": "tmdb_search",
-                                "result": f"No results found for '{query}'"
-                            })
-                    except Exception as e:
-                        logger.error(f"TMDB search error: {e}")
-                        tool_outputs.append({
-                            "tool": "tmdb_search",
-                            "result": f"Error searching TMDB: {str(e)}"
-                        })
-                
-                elif tool.name == "search":
-                    # Execute Search
-                    args = tool.arguments
-                    logger.info(f"Executing Search: {args}")
-                    
-                    q = args.get("query")
-                    t = args.get("type", "movie")
-                    
-                    # Call Zilean (Reusing logic from mcp.py would be ideal, but for now duplicate/call service directly)
-                    # Simple title search for now
-                    results = await zilean_service.search_stream(title=q)
-                    
-                    # Simplify results for LLM consumption (don't send 1000 lines of JSON)
-                    summary = [f"{r.get('raw_title')} ({r.get('size')})" for r in results[:5]]
-                    tool_outputs.append({
-                        "tool": "search",
-                        "result": f"Found {len(results)} results. Top 5: {', '.join(summary)}"
-                    })
-                
-                elif tool.name == "trakt_stats" and trakt_token:
-                    logger.info("Executing trakt_stats")
-                    trakt = create_trakt_service(trakt_token)
-                    try:
-                        stats = await trakt.get_watching_stats()
-                        # Format stats for AI
-                        movies_watched = stats.get("movies", {}).get("watched", 0)
-                        episodes_watched = stats.get("episodes", {}).get("watched", 0)
-                        minutes_watched = stats.get("minutes", 0)
-                        hours = minutes_watched // 60
-                        
-                        result_text = f"User has watched {movies_watched} movies and {episodes_watched} episodes. Total time: {hours} hours."
-                        tool_outputs.append({"tool": "trakt_stats", "result": result_text})
-                    except Exception as e:
-                        logger.error(f"Trakt stats error: {e}")
-                        tool_outputs.append({"tool": "trakt_stats", "result": f"Error fetching stats: {str(e)}"})
-                
-                elif tool.name == "trakt_history_search" and trakt_token:
-                    args = tool.arguments
-                    title = args.get("title", "")
-                    logger.info(f"Executing trakt_history_search for: {title}")
-                    
-                    trakt = create_trakt_service(trakt_token)
-                    try:
-                        results = await trakt.search_history(title)
-                        if results:
-                            result_text = f"Yes, user watched '{title}'. Found {len(results)} occurrences in history."
-                        else:
-                            result_text = f"No, user has not watched '{title}'."
-                        tool_outputs.append({"tool": "trakt_history_search", "result": result_text})
-                    except Exception as e:
-                        logger.error(f"Trakt history search error: {e}")
-                        tool_outputs.append({"tool": "trakt_history_search", "result": f"Error searching history: {str(e)}"})
-                
-                elif tool.name == "trakt_continue_watching" and trakt_token:
-                    logger.info("Executing trakt_continue_watching")
-                    trakt = create_trakt_service(trakt_token)
-                    try:
-                        items = await trakt.get_continue_watching()
-                        if items:
-                            summaries = []
-                            for item in items[:5]:  # Top 5
-                                title = item.get("show", {}).get("title") or item.get("movie", {}).get("title", "Unknown")
-                                summaries.append(title)
-                            result_text = f"User is currently watching: {', '.join(summaries)}"
-                        else:
-                            result_text = "No shows currently in progress."
-                        tool_outputs.append({"tool": "trakt_continue_watching", "result": result_text})
-                    except Exception as e:
-                        logger.error(f"Trakt continue watching error: {e}")
-                        tool_outputs.append({"tool": "trakt_continue_watching", "result": f"Error fetching continue watching: {str(e)}"})
-
-            # 3. Feed results back to LLM
-            # We construct a synthetic history:
-            # [...History, UserQuery, ModelResponse(ToolCall), FunctionResponse(Result)]
-            
-            # Note: Gemini Provider `complete` method recreated the chat session each time.
-            # To feed back results, we need to call it again with updated history.
-            # Constructing "FunctionResponse" messages for Gemini is specific.
-            # For this generic abstraction, let's just append a System message with the result 
-            # and ask for the final answer.
-            
-            tool_result_text = "\n".join([f"Tool '{to['tool']}' Output: {to['result']}" for to in tool_outputs])
-            
-            follow_up_messages = current_messages + [
-                {"role": "assistant", "content": "I need to check the database..."}, # Placeholder for tool thought
-                {"role": "user", "content": f"System Tool Output:\n{tool_result_text}\n\nBased on these results, please answer the user's original question."}
-            ]
-            
-            final_response = await self.provider.complete(follow_up_messages)
-            return final_response.content
+        # 3. Feed results back to LLM
+        # We construct a native tool round:
+        # [...History, UserQuery, ModelResponse(ToolCall), FunctionResponse(Result)]
+        # The provider needs one result per call, in the order of the calls.
+        tool_messages = []
+        for tool, output in zip(tool_calls, outputs):
+            if isinstance(output, BaseException):
+                logger.error("Tool {} failed: {}", tool.name, output)
+                result = f"Error running {tool.name}: {str(output)}"
+            elif output:
+                result = output["result"]
+            else:
+                result = f"Tool '{tool.name}' is not available for this request."
+            # Each output is capped so one verbose tool can't dominate the follow-up prompt
+            tool_messages.append({
+                "role": "tool",
+                "name": tool.name,
+                "content": textwrap.shorten(result, _TOOL_RESULT_MAX_CHARS, placeholder=" ...")
+            })
 
-        return response.content
+        follow_up_messages = current_messages + [
+            {"role": "assistant", "content": "", "tool_calls": [tool.model_dump() for tool in tool_calls]}
+        ] + tool_messages
+        return follow_up_messages, tool_messages
 
 vector_service = VectorService()
@@ -1,27 +1,132 @@
+import asyncio
+import hashlib
+import re
+import orjson
 import httpx
 from loguru import logger
-from typing import List, Optional, Any
+from typing import List, Optional, Any, Dict, Hashable
+from cachetools import TTLCache
 from app.core.config import settings
-from async_lru import alru_cache
+from app.core.cache import redis_memoize, singleflight
+from app.core.http import http_client
+from app.core.breaker import CircuitBreaker
+
+# Season (+ optional episode) marker: S01, Season 1, S01E02, S01.E02, 1x02
+_SE_RE = re.compile(r'(?:S|SEASON\W?)(?P<s1>\d{1,2})(?:[^0-9]{0,3}E(?P<e1>\d{1,3}))?|(?P<s2>\d{1,2})[xX](?P<e2>\d+)', re.I)
+_SE_SCAN_LIMIT = 160  # chars of each title searched for the marker
 
 class ZileanService:
     def __init__(self):
         self.base_url = settings.ZILEAN_API_URL
-        self.client = httpx.AsyncClient(timeout=10.0)
+        self.client = http_client
+        # Tier 1: per-worker memory. Clients re-query the same title on every
+        # UI navigation, so most searches never leave the process.
+        self._cache: TTLCache = TTLCache(maxsize=4096, ttl=180)
+        # Searches that found nothing, kept briefly so the LLM's repeated
+        # lookups don't hammer Zilean, but a title is found soon after it appears
+        self._empty: TTLCache = TTLCache(maxsize=4096, ttl=60)
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self._breaker = CircuitBreaker("Zilean", settings.ZILEAN_BREAKER_FAILS, settings.ZILEAN_BREAKER_RESET_S)
+
+    @staticmethod
+    def _canonical(title: str, year: int, imdb_id: str, season: int, episode: int) -> tuple:
+        # Canonical form of the query: the upstream params skip falsy values, so
+        # None and 0 / "" ask Zilean the same thing and share one entry
+        return ((title or "").strip().casefold(), year or None, imdb_id or None, season or None, episode or None)
+
+    @staticmethod
+    def _cache_key(query: tuple) -> bytes:
+        return hashlib.sha1("|".join("" if v is None else str(v) for v in query).encode()).digest()
 
+    def is_cached(self, title: str, year: int = None, imdb_id: str = None, season: int = None, episode: int = None) -> bool:
+        """
+        True if this search would be answered from the in-memory tier.
+        """
+        key = self._cache_key(self._canonical(title, year, imdb_id, season, episode))
+        return key in self._cache or key in self._empty
 
     async def search_stream(self, title: str, year: int = None, imdb_id: str = None, season: int = None, episode: int = None, **kwargs) -> List[dict]:
         """
         Public wrapper that calls the cached internal method.
+        Memory (TTL) -> Redis (if configured) -> Zilean.
+        """
+        query = self._canonical(title, year, imdb_id, season, episode)
+        key = self._cache_key(query)
+        results = self._lookup(key)
+        if results is None:
+            # A burst of identical misses shares one fetch (dogpile)
+            results = await singleflight(self._inflight, key, lambda: self._fetch_and_store(key, query))
+        return results if results is not None else []
+
+    async def _fetch_and_store(self, key: bytes, query: tuple) -> Optional[List[dict]]:
+        title, year, imdb_id, season, episode = query
+        # Canonical args, so the Redis tier shares entries the same way memory does
+        results = await self._fetch_cached(title=title, year=year, imdb_id=imdb_id, season=season, episode=episode)
+        if results:
+            self._cache[key] = results
+        elif results is not None:
+            self._empty[key] = True
+        return results
+
+    def _lookup(self, key: bytes) -> Optional[List[dict]]:
+        """
+        Results from the memory tier, [] for a recent empty search, None on a miss.
+        """
+        results = self._cache.get(key)
+        if results is None and key in self._empty:
+            return []
+        return results
+
+    @staticmethod
+    def filter_episode(results: List[dict], season: int, episode: Optional[int] = None) -> List[dict]:
+        """
+        Drops title-only search results that name a different season/episode.
+        Keeps exact episode matches, season packs (matching season, no episode)
+        and ambiguous files (no S/E detected).
         """
-        # Convert args to hashable types if needed, but int/str are fine.
-        return await self._fetch_cached(title, year, imdb_id, season, episode)
+        filtered = []
+        for item in results:
+            item_title = item.get("raw_title") or item.get("filename") or ""
+
+            # Parse Season / Episode in one scan
+            # Look for S01, Season 1, S01E02, 1x02
+            # (case-insensitive pattern; the marker sits well before the tag noise at the end)
+            se_match = _SE_RE.search(item_title, 0, _SE_SCAN_LIMIT)
+            if se_match:
+                item_season = int(se_match["s1"] or se_match["s2"])
+                item_episode_str = se_match["e1"] or se_match["e2"]
+                item_episode = int(item_episode_str) if item_episode_str else None
+            else:
+                item_season = item_episode = None
+
+            # Logic:
+            # If we detect a Season, it MUST match the requested season
+            if item_season and item_season != season:
+                continue # Wrong Season
 
-    @alru_cache(maxsize=256)
+            # If we detect an Episode, it MUST match the requested episode
+            # UNLESS we want to allow full season packs, but usually season packs don't have "E01" in the main title 
+            # (or if they do, it's usually "S01E01-E10")
+            # For safety, if we see a specific single episode number that ISN'T ours, skip it.
+            if item_episode and episode and item_episode != episode:
+                # Check for multi-episode range (e.g. E01-E10) - simplifying for now
+                # If simple mismatch, skip
+                continue 
+
+            filtered.append(item)
+
+        return filtered
+
+    @redis_memoize(ttl=300, prefix="zilean:search", empty_ttl=60)
     async def _fetch_cached(self, title: str, year: int, imdb_id: str, season: int, episode: int) -> List[dict]:
         """
         Cached Zilean Search.
+        Returns None (not cached) on failure or while the circuit is open.
         """
+        if self._breaker.is_open:
+            logger.warning("Zilean circuit open, skipping search")
+            return None
+
         try:
             params = {}
             if title: params["Query"] = title
@@ -30,17 +135,21 @@ class ZileanService:
             if season: params["Season"] = season
             if episode: params["Episode"] = episode
             
-            logger.info(f"Zilean Search (Network): {self.base_url}/dmm/filtered with params {params}")
+            logger.info("Zilean Search (Network): {}/dmm/filtered with params {}", self.base_url, params)
             response = await self.client.get(f"{self.base_url}/dmm/filtered", params=params) 
             response.raise_for_status()
             
-            results = response.json()
-            logger.info(f"Zilean returned {len(results) if isinstance(results, list) else 0} results")
+            results = orjson.loads(response.content)
+            logger.info("Zilean returned {} results", len(results) if isinstance(results, list) else 0)
+            self._breaker.record_success()
             
             return results if isinstance(results, list) else []
             
         except Exception as e:
-            logger.error(f"Zilean Search Failed: {e}")
-            return []
+            logger.error("Zilean Search Failed: {}", e)
+            # A 4xx is about this query, not Zilean being down
+            if not (isinstance(e, httpx.HTTPStatusError) and e.response.status_code < 500):
+                self._breaker.record_failure()
+            return None
 
 zilean_service = ZileanService()
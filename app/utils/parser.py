@@ -1,144 +1,257 @@
 import re
-from typing import List, Dict, Any
+import bisect
+import functools
+import itertools
+from typing import List, Dict, Any, Optional, Tuple
+
+# Playable container extensions (lowercase, no dot)
+VIDEO_EXTS = frozenset(("mp4", "mkv", "avi", "mov", "webm"))
+
+# Every keyword the helpers below look for. A filename is classified in one
+# regex pass into a bitset with one bit per keyword (see _classify).
+# Each group's keywords are contiguous: the score tables slice bits by group.
+_KEYWORDS = (
+    # quality
+    "2160p", "4k", "uhd", "1080p", "720p", "480p",
+    # codecs
+    "hevc", "h265", "x265", "av1", "h264", "x264", "avc",
+    # audio
+    "atmos", "dts-hd", "dts:x", "dtsx", "truehd",
+    "eac3", "ddp", "dd+", "dolby digital plus", "ac3", "dd5.1", "aac",
+    # hdr
+    "dv", "dovi", "dolby vision", "hdr10+", "hdr10plus", "hdr", "hdr10",
+    # source
+    "remux", "bdremux", "bluray", "bdrip", "brrip",
+    "webdl", "web-dl", "webrip", "hbo", "amzn", "nf", "hdtv",
+    "cam", "ts", "telesync", "camrip", "sample",
+)
+_BIT = {kw: 1 << i for i, kw in enumerate(_KEYWORDS)}
+
+def _mask(*keywords: str) -> int:
+    bits = 0
+    for kw in keywords:
+        bits |= _BIT[kw]
+    return bits
+
+# A hit on a keyword also counts as a hit on every keyword inside it
+# ("hdr10+" contains "hdr10" and "hdr", "camrip" contains "cam")
+_HIT_BITS = {kw: _mask(*(k for k in _KEYWORDS if k in kw)) for kw in _KEYWORDS}
+
+# Zero-width lookahead so matches may overlap: the scan tries every position
+# and, longest keyword first, reports the longest one starting there. Shorter
+# keywords at the same position are its prefixes and come from _HIT_BITS.
+_KEYWORD_RE = re.compile(
+    "(?=(" + "|".join(re.escape(kw) for kw in sorted(_KEYWORDS, key=len, reverse=True)) + "))"
+)
+
+Q_4K = _mask("2160p", "4k", "uhd")
+Q_1080P = _BIT["1080p"]
+Q_720P = _BIT["720p"]
+Q_480P = _BIT["480p"]
+
+C_HEVC = _mask("hevc", "h265", "x265")
+C_AV1 = _BIT["av1"]
+C_H264 = _mask("h264", "x264", "avc")
+
+A_ATMOS = _BIT["atmos"]
+A_DTSX = _mask("dts-hd", "dts:x", "dtsx")
+A_TRUEHD = _BIT["truehd"]
+A_EAC3 = _mask("eac3", "ddp", "dd+", "dolby digital plus")
+A_AC3 = _mask("ac3", "dd5.1")
+A_AAC = _BIT["aac"]
+
+H_DV = _mask("dv", "dovi", "dolby vision")
+H_HDR10PLUS = _mask("hdr10+", "hdr10plus")
+H_HDR10 = _mask("hdr", "hdr10")
+
+S_REMUX = _mask("remux", "bdremux")
+S_BLURAY = _mask("bluray", "bdrip", "brrip")
+S_WEB = _mask("webdl", "web-dl", "webrip", "hbo", "amzn", "nf")
+S_HDTV = _BIT["hdtv"]
+S_CAM = _mask("cam", "ts", "telesync", "camrip")
+
+# score_file filters
+X_HEVC = C_HEVC
+X_EAC3 = _mask("eac3", "ddp", "dd+", "atmos")
+X_DV = _mask("dv", "dovi", "dolby vision", "hdr10+")
+GARBAGE = S_CAM | _BIT["sample"]
+
+def _score_table(first: str, last: str, score) -> tuple:
+    """
+    (shift, mask, table) for the keywords first..last of _KEYWORDS:
+    table[(bits >> shift) & mask] is score(bits) for every combination.
+    """
+    shift = _KEYWORDS.index(first)
+    width = _KEYWORDS.index(last) - shift + 1
+    return shift, (1 << width) - 1, tuple(score(i << shift) for i in range(1 << width))
+
+# score_file points per group, indexed by the group's slice of the bitset
+_QUALITY_SCORE = _score_table("2160p", "480p", lambda b: 200 if b & Q_4K else 100 if b & Q_1080P else 50 if b & Q_720P else 0)
+_SOURCE_SCORE = _score_table("remux", "nf", lambda b: 100 if b & S_REMUX else 80 if b & S_BLURAY else 50 if b & S_WEB else 0)
+_AUDIO_SCORE = _score_table("atmos", "aac", lambda b: 40 if b & (A_ATMOS | A_TRUEHD | A_DTSX) else 20 if b & A_EAC3 else 0)
+_HDR_SCORE = _score_table("dv", "hdr10", lambda b: (50 if b & H_DV else 0) + (30 if b & (H_HDR10PLUS | H_HDR10) else 0))
+
+# (mask, label) for the list helpers, in output order
+_CODEC_LABELS = (
+    (C_HEVC, "hevc"), (C_AV1, "av1"), (C_H264, "h264"),
+)
+_AUDIO_LABELS = (
+    (A_ATMOS, "atmos"), (A_DTSX, "dts-x"), (A_TRUEHD, "truehd"),
+    (A_EAC3, "eac3"), (A_AC3, "ac3"), (A_AAC, "aac"),
+)
+_HDR_LABELS = (
+    (H_DV, "dolby_vision"), (H_HDR10PLUS, "hdr10+"), (H_HDR10, "hdr10"),
+)
+
+_GROUP_RE = re.compile(r'-([a-zA-Z0-9]+)(?:\.[a-z0-9]{3,4})?$')
+_NOT_GROUPS = frozenset(("264", "265", "hevc", "10bit", "hdr",
+                         "remux", "4k", "1080p", "720p", "webdl", "bluray"))
 
 class VideoParser:
+    @staticmethod
+    def is_video(filename: str) -> bool:
+        _, dot, ext = filename.rpartition(".")
+        return bool(dot) and ext.lower() in VIDEO_EXTS
+
+    @staticmethod
+    @functools.lru_cache(maxsize=16384)
+    def _classify(filename: str) -> int:
+        """
+        Bitset of the keywords found anywhere in the (lowercased) filename,
+        in one left-to-right pass. Cached: the same release names come back
+        on every search, and every helper below goes through here.
+        """
+        bits = 0
+        for kw in _KEYWORD_RE.findall(filename.lower()):
+            bits |= _HIT_BITS[kw]
+        return bits
+
     @staticmethod
     def get_quality(filename: str) -> str:
-        filename = filename.lower()
-        if any(x in filename for x in ["2160p", "4k", "uhd"]):
+        return VideoParser._quality(VideoParser._classify(filename))
+
+    @staticmethod
+    def _quality(bits: int) -> str:
+        if bits & Q_4K:
             return "4K"
-        if "1080p" in filename:
+        if bits & Q_1080P:
             return "1080p"
-        if "720p" in filename:
+        if bits & Q_720P:
             return "720p"
-        if "480p" in filename:
+        if bits & Q_480P:
             return "480p"
         return "Unknown"
 
     @staticmethod
-    def get_codecs(filename: str) -> List[str]:
-        filename = filename.lower()
-        codecs = []
-        if any(x in filename for x in ["hevc", "h265", "x265"]):
-            codecs.append("hevc")
-        if any(x in filename for x in ["av1"]):
-            codecs.append("av1")
-        if any(x in filename for x in ["h264", "x264", "avc"]):
-            codecs.append("h264")
-        return codecs
+    def get_codecs(filename: str) -> Tuple[str, ...]:
+        return VideoParser._labels(_CODEC_LABELS, VideoParser._classify(filename))
 
     @staticmethod
-    def get_audio(filename: str) -> List[str]:
-        filename = filename.lower()
-        audio = []
-        if any(x in filename for x in ["atmos"]):
-            audio.append("atmos")
-        if any(x in filename for x in ["dts-hd", "dts:x", "dtsx"]):
-            audio.append("dts-x")
-        if any(x in filename for x in ["truehd"]):
-            audio.append("truehd")
-        if any(x in filename for x in ["eac3", "ddp", "dd+", "dolby digital plus"]):
-            audio.append("eac3")
-        if any(x in filename for x in ["ac3", "dd5.1"]):
-            audio.append("ac3")
-        if any(x in filename for x in ["aac"]):
-            audio.append("aac")
-        return audio
+    def get_audio(filename: str) -> Tuple[str, ...]:
+        return VideoParser._labels(_AUDIO_LABELS, VideoParser._classify(filename))
         
     @staticmethod
-    def get_hdr(filename: str) -> List[str]:
-        filename = filename.lower()
-        hdr = []
-        if any(x in filename for x in ["dv", "dovi", "dolby vision"]):
-            hdr.append("dolby_vision")
-        if any(x in filename for x in ["hdr10+", "hdr10plus"]):
-            hdr.append("hdr10+")
-        elif any(x in filename for x in ["hdr", "hdr10"]): # check hdr after hdr10+
-            hdr.append("hdr10")
-        return hdr
+    def get_hdr(filename: str) -> Tuple[str, ...]:
+        bits = VideoParser._classify(filename)
+        if bits & H_HDR10PLUS: # an hdr10+ name sets the hdr10 bits too; plus wins
+            bits &= ~H_HDR10
+        return VideoParser._labels(_HDR_LABELS, bits)
+
+    @staticmethod
+    def _labels(table: Tuple[Tuple[int, str], ...], bits: int) -> Tuple[str, ...]:
+        # Tuples, not fresh lists; no match gives the shared empty tuple
+        return tuple(label for mask, label in table if bits & mask)
 
     @staticmethod
     def get_source(filename: str) -> str:
-        filename = filename.lower()
-        if any(x in filename for x in ["remux", "bdremux"]):
+        return VideoParser._source(VideoParser._classify(filename))
+
+    @staticmethod
+    def _source(bits: int) -> str:
+        if bits & S_REMUX:
             return "remux"
-        if any(x in filename for x in ["bluray", "bdrip", "brrip"]):
+        if bits & S_BLURAY:
             return "bluray"
-        if any(x in filename for x in ["webdl", "web-dl", "webrip", "hbo", "amzn", "nf"]):
+        if bits & S_WEB:
             return "web"
-        if any(x in filename for x in ["hdtv"]):
+        if bits & S_HDTV:
             return "hdtv"
-        if any(x in filename for x in ["cam", "ts", "telesync", "camrip"]):
+        if bits & S_CAM:
             return "cam"
         return "unknown"
 
     @staticmethod
+    @functools.lru_cache(maxsize=512)
+    def episode_pattern(season: int, episode: int) -> re.Pattern:
+        """
+        One compiled, case-insensitive pattern for S01E01 / S1E1 / 1x01 / 1x1,
+        built once per (season, episode).
+        """
+        return re.compile(
+            rf"S{season:02d}E{episode:02d}|S{season}E{episode}|{season}x{episode:02d}|{season}x{episode}",
+            re.IGNORECASE
+        )
+
+    @staticmethod
+    def first_episode_match(filenames: List[str], season: int, episode: int) -> Optional[int]:
+        """
+        Index of the first filename that names the episode, or None.
+        All names are searched in one regex pass over a newline-joined buffer
+        (the pattern can't span a newline); the hit maps back via bisect.
+        """
+        if not filenames:
+            return None
+        match = VideoParser.episode_pattern(season, episode).search("\n".join(filenames))
+        if match is None:
+            return None
+        ends = list(itertools.accumulate(len(name) + 1 for name in filenames))
+        return bisect.bisect_right(ends, match.start())
+
+    @staticmethod
+    @functools.lru_cache(maxsize=16384)
     def get_release_group(filename: str) -> str:
-        # Regex to find group at end of filename: "-Group" or "-Group.mkv"
+        # Group at end of filename: "-Group" or "-Group.mkv"
         # Avoids common false positives like "-2160p" or "-10bit"
-        try:
-            match = re.search(r'-([a-zA-Z0-9]+)(?:\.[a-z0-9]{3,4})?$', filename)
-            if match:
-                group = match.group(1)
-                # Filter out technical terms that might look like groups
-                if group.lower() not in ["264", "265", "hevc", "10bit", "hdr", 
-                                       "remux", "4k", "1080p", "720p", "webdl", "bluray"]:
-                    return group
-        except:
-            pass
+        match = _GROUP_RE.search(filename)
+        if match:
+            group = match.group(1)
+            # Filter out technical terms that might look like groups
+            if group.lower() not in _NOT_GROUPS:
+                return group
         return ""
 
     @staticmethod
+    @functools.lru_cache(maxsize=8192)
     def score_file(filename: str, size_bytes: int = 0, 
                   exclude_hevc: bool = False,
                   exclude_eac3: bool = False,
                   exclude_dolby_vision: bool = False) -> int:
         
-        filename = filename.lower()
-        score = 0
+        # One pass over the name; everything below is bit tests
+        bits = VideoParser._classify(filename)
         
         # --- HARD FILTERS (Negative Infantry) ---
         # Immediate huge penalty for excluded items
-        if exclude_hevc and any(x in filename for x in ["hevc", "h265", "x265"]):
-            return -1000
-        if exclude_eac3 and any(x in filename for x in ["eac3", "ddp", "dd+", "atmos"]):
-            return -1000
-        if exclude_dolby_vision and any(x in filename for x in ["dv", "dovi", "dolby vision", "hdr10+"]):
+        excluded = (X_HEVC if exclude_hevc else 0) | (X_EAC3 if exclude_eac3 else 0) | (X_DV if exclude_dolby_vision else 0)
+        if bits & excluded:
             return -1000
             
         # Filter Garbage
-        if any(x in filename for x in ["cam", "ts", "telesync", "camrip", "sample"]):
+        if bits & GARBAGE:
             return -500
             
-        # --- BASE QUALITY SCORE ---
-        quality = VideoParser.get_quality(filename)
-        if quality == "4K": score += 200
-        elif quality == "1080p": score += 100
-        elif quality == "720p": score += 50
-        
-        # --- SOURCE SCORE ---
-        source = VideoParser.get_source(filename)
-        if source == "remux": score += 100
-        elif source == "bluray": score += 80
-        elif source == "web": score += 50
-        
-        # --- AUDIO SCORE ---
-        # Prefer higher quality audio usually
-        audio = VideoParser.get_audio(filename)
-        if "atmos" in audio or "truehd" in audio or "dts-x" in audio:
-            score += 40
-        elif "eac3" in audio:
-            score += 20
-            
-        # --- HDR SCORE ---
-        hdr = VideoParser.get_hdr(filename)
-        if "dolby_vision" in hdr: score += 50
-        if "hdr10" in hdr or "hdr10+" in hdr: score += 30
+        # --- QUALITY / SOURCE / AUDIO / HDR SCORE ---
+        # Table lookups (see _score_table): 4K 200 / 1080p 100 / 720p 50,
+        # remux 100 / bluray 80 / web 50, atmos-truehd-dts:x 40 / eac3 20,
+        # dolby vision 50 + hdr10(+) 30
+        score = 0
+        for shift, mask, table in (_QUALITY_SCORE, _SOURCE_SCORE, _AUDIO_SCORE, _HDR_SCORE):
+            score += table[(bits >> shift) & mask]
         
         # --- SIZE FACTOR ---
         # Prefer larger files (within reason) as proxy for bitrate
         # +1 point per GB, max 50 points
-        gb_size = size_bytes / (1024*1024*1024)
-        score += min(int(gb_size), 50)
+        # (size_bytes is a non-negative int, so >> 30 is whole GiB)
+        score += min(size_bytes >> 30, 50)
         
         return score
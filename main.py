@@ -1,30 +1,56 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from loguru import logger
 from app.core.config import settings
+from app.core.responses import ORJSONResponse
+from app.core.http import close_http_client
 from app.api.mcp import router as mcp_router
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    logger.info(f"Starting {settings.PROJECT_NAME} v{settings.VERSION}")
+    yield
+    await close_http_client()
+
 app = FastAPI(
     title=settings.PROJECT_NAME,
     version=settings.VERSION,
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan,
 )
 
 # CORS (Allow all for development/mobile access)
+# No cookies are used, so credentials stay off: with a wildcard origin that
+# lets Starlette send its static "*" header rather than echo each Origin back
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
-    allow_credentials=True,
+    allow_credentials=False,
     allow_methods=["*"],
     allow_headers=["*"],
 )
 
-@app.on_event("startup")
-async def startup_event():
-    logger.info(f"Starting {settings.PROJECT_NAME} v{settings.VERSION}")
+# Rendered once; the landing/health check returns the same bytes every time
+_ROOT_RESPONSE = ORJSONResponse({"message": "VOID Omega MCP is running"})
 
 @app.get("/")
 async def root():
-    return {"message": "VOID Omega MCP is running"}
+    # Still async: a sync endpoint would be dispatched to the threadpool
+    return _ROOT_RESPONSE
 
 app.include_router(mcp_router, prefix="/mcp")
 
+if __name__ == "__main__":
+    import uvicorn
+
+    # "auto" picks uvloop + httptools (uvicorn[standard]) where they are
+    # available and falls back to asyncio + h11 elsewhere (e.g. Windows)
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=settings.PORT,
+        workers=settings.WORKERS,
+        loop="auto",
+        http="auto",
+    )